@@ -1,3 +1,5 @@
+import os
+
 from back.models import AdminPermission, AdminUser, Role
 from django.contrib.auth.hashers import check_password, make_password
 from django.core.paginator import InvalidPage, Paginator
@@ -6,7 +8,8 @@ from ninja import Form, Query, Router
 
 from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
 from backend.utils.auth import auth_admin
-from backend.utils.response_types import Response
+from backend.utils.response_types import Response, cursor_page
+from backend.utils.weiyi import aio, async_weiyi_client, treasure_api, weiyi_client
 
 router = Router(tags=["后台"])
 redis_conn = get_redis_connection()
@@ -128,6 +131,8 @@ def get_admin_user_info_list(
     size: int = Query(10, description="每页数量"),
     nickname: str = Query("", description="显示名称筛选"),
     username: str = Query("", description="登录名称筛选"),
+    last_id: int | None = Query(None, description="游标分页: 上一页返回的 next_id, 第一页传 0"),
+    with_total: bool = Query(False, description="游标分页: 是否返回总数"),
 ):
     admin_user = auth_admin.get_login_user(request)
     queryset = AdminUser.objects.order_by("-id")
@@ -138,11 +143,16 @@ def get_admin_user_info_list(
     if username:
         queryset = queryset.filter(username__icontains=username)
 
-    paginator = Paginator(queryset, size)
-    try:
-        page_business = paginator.page(page)
-    except InvalidPage:
-        return Response.error(msg="页数错误")
+    if last_id is not None:
+        page_business = cursor_page(queryset, size, last_id=last_id, with_total=with_total)
+        admin_users = page_business.object_list
+    else:
+        paginator = Paginator(queryset, size)
+        try:
+            page_business = paginator.page(page)
+        except InvalidPage:
+            return Response.error(msg="页数错误")
+        admin_users = page_business
     data = [
         {
             "id": i.pk,
@@ -153,8 +163,10 @@ def get_admin_user_info_list(
             "role_id": i.role.pk if i.role else 0,
             "role_name": i.role_name,
         }
-        for i in page_business
+        for i in admin_users
     ]
+    if last_id is not None:
+        return Response.cursor_list(data=data, page=page_business)
     return Response.page_list(data, total_page=paginator.num_pages, total=paginator.count)
 
 
@@ -428,3 +440,22 @@ def post_admin_user_role_edit(
     change_user.save()
 
     return Response.ok()
+
+
+@router.get("admin/weiyi/http/stats", auth=auth_admin.get_auth(), summary="weiyi 接口耗时和熔断状态")
+def get_admin_weiyi_http_stats(
+    request: HttpRequest,
+):
+    """统计在各进程内存中, 只返回处理本次请求的 worker 的数据"""
+    admin_user = auth_admin.get_login_user(request)
+    if not admin_user.is_admin:
+        return Response.error(msg="没有权限")
+
+    data = {
+        "pid": os.getpid(),
+        "oauth": weiyi_client.http.stats(),
+        "oauth_async": async_weiyi_client.http.stats(),
+        "treasure": treasure_api.http.stats(),
+        "treasure_async": aio.treasure_http.stats(),
+    }
+    return Response.data(data)
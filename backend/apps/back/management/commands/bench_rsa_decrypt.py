@@ -0,0 +1,47 @@
+import os
+import time
+from io import BytesIO
+
+from Cryptodome.Cipher.PKCS1_v1_5 import PKCS115_Cipher
+from Cryptodome.PublicKey import RSA
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.utils.weiyi.crypt import RsaCipher, batched
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark RsaCipher.decrypt against the previous per-block BytesIO implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bits", type=int, default=1024, help="RSA key size")
+        parser.add_argument("--sizes", type=int, nargs="+", default=[4, 32, 128], help="plaintext sizes (KiB)")
+        parser.add_argument("--repeat", type=int, default=5, help="runs per size")
+        parser.add_argument("--workers", type=int, default=4, help="thread pool size for the threaded variant")
+
+    def handle(self, *args, **options):
+        key = RSA.generate(options["bits"])
+        cipher = RsaCipher.new(key)
+        threaded = RsaCipher(key, os.urandom, max_workers=options["workers"])
+        key_length = key.size_in_bytes()
+
+        def previous(ciphertext: bytes) -> bytes:
+            # 优化前: bytes 切片, BytesIO 拼接
+            buffer = BytesIO()
+            for block in batched(ciphertext, key_length):
+                buffer.write(PKCS115_Cipher.decrypt(cipher, block, b""))
+            return buffer.getvalue()
+
+        variants = [("previous", previous), ("current", cipher.decrypt), ("threaded", threaded.decrypt)]
+        for size in options["sizes"]:
+            message = os.urandom(size * 1024)
+            ciphertext = cipher.encrypt(message)
+            for name, decrypt in variants:
+                if decrypt(ciphertext) != message:
+                    raise CommandError(f"{name} decrypt mismatch")
+            results = []
+            for name, decrypt in variants:
+                started = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    decrypt(ciphertext)
+                results.append(f"{name}={(time.perf_counter() - started) / options['repeat'] * 1000:.1f}ms")
+            print(f"{size}KiB blocks={len(ciphertext) // key_length} " + " ".join(results))
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.utils.weiyi import treasure_api
+
+
+class Command(BaseCommand):
+    help = "Benchmark iter_user_treasure_pages against a local stub server at several concurrency levels"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--total", type=int, default=457, help="treasures held by the stub user")
+        parser.add_argument("--latency", type=float, default=0.05, help="stub response delay per page (seconds)")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10], help="concurrency levels")
+        parser.add_argument("--repeat", type=int, default=3, help="runs per concurrency level")
+
+    def handle(self, *args, **options):
+        total, latency = options["total"], options["latency"]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                page = int(body["pageCount"])
+                time.sleep(latency)
+                start = (page - 1) * treasure_api.PAGE_SIZE
+                details = [
+                    {"name": f"n{i}", "commodityUuid": "bench", "number": i, "cover": "", "typeMarket": 1}
+                    for i in range(start, min(start + treasure_api.PAGE_SIZE, total))
+                ]
+                content = json.dumps({"code": 200, "data": {"totalCount": total, "treasureDetails": details}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        expected = list(range(min(total, treasure_api.PAGE_SIZE * treasure_api.MAX_PAGE)))
+        try:
+            with mock.patch.object(treasure_api, "url", f"http://127.0.0.1:{server.server_port}/"):
+                for concurrency in options["concurrency"]:
+                    timings = []
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        numbers = [
+                            i.number
+                            for data in treasure_api.iter_user_treasure_pages("bench", concurrency=concurrency)
+                            for i in data.treasureDetails or []
+                        ]
+                        timings.append(time.perf_counter() - started)
+                        if numbers != expected:
+                            raise CommandError(f"concurrency={concurrency} returned {len(numbers)} items out of order")
+                    print(
+                        f"concurrency={concurrency} pages={-(-len(expected) // treasure_api.PAGE_SIZE)} "
+                        f"best={min(timings):.3f}s avg={sum(timings) / len(timings):.3f}s"
+                    )
+        finally:
+            server.shutdown()
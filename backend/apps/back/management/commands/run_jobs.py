@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from backend.utils import job_queue
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the redis job queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--burst",
+            "-b",
+            action="store_true",
+            default=False,
+            help="exit when the queue is empty",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            default=False,
+            help="print queue depth and exit",
+        )
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            print(job_queue.stats())
+            return
+        job_queue.run_worker(burst=options["burst"])
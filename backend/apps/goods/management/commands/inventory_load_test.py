@@ -0,0 +1,100 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+
+from backend.utils import inventory
+from goods.models import Goods
+
+
+class Command(BaseCommand):
+    help = "Load test hot-SKU stock reservation on a temporary unlisted goods (redis reserve vs row lock)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stock", type=int, default=100, help="initial inventory")
+        parser.add_argument("--threads", type=int, default=32, help="concurrent buyers")
+        parser.add_argument("--requests", type=int, default=1000, help="total buy attempts")
+        parser.add_argument(
+            "--mode",
+            choices=["redis", "lock"],
+            default="redis",
+            help="redis: inventory.reserve; lock: select_for_update on the goods row",
+        )
+
+    def buy_with_lock(self, goods_id: int) -> bool:
+        with transaction.atomic():
+            goods = Goods.objects.select_for_update().only("inventory").get(id=goods_id)
+            if goods.inventory < 1:
+                return False
+            Goods.objects.filter(id=goods_id).update(inventory=goods.inventory - 1)
+            return True
+
+    def handle(self, *args, **options):
+        stock, threads, requests, mode = options["stock"], options["threads"], options["requests"], options["mode"]
+        if min(stock, threads, requests) < 1:
+            raise CommandError("stock, threads and requests must be positive")
+
+        goods = Goods.objects.create(
+            name="inventory load test",
+            image="",
+            description="",
+            original_price=0,
+            discount_price=0,
+            inventory=stock,
+            inventory_total=stock,
+            status=False,
+        )
+        inventory.reset(goods.id)
+        buy = (lambda: inventory.reserve(goods.id, 1)) if mode == "redis" else (lambda: self.buy_with_lock(goods.id))
+
+        latencies = []
+        sold = 0
+        remaining = requests
+        lock = threading.Lock()
+
+        def worker():
+            nonlocal sold, remaining
+            try:
+                while True:
+                    with lock:
+                        if remaining <= 0:
+                            return
+                        remaining -= 1
+                    started = time.perf_counter()
+                    ok = buy()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        sold += ok
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            for i in workers:
+                i.start()
+            for i in workers:
+                i.join()
+            elapsed = time.perf_counter() - started
+            close_old_connections()
+
+            if mode == "redis":
+                inventory.reconcile()
+            goods.refresh_from_db(fields=["inventory"])
+            latencies.sort()
+            print(f"mode={mode} stock={stock} threads={threads} requests={len(latencies)}")
+            print(f"throughput={len(latencies) / elapsed:.0f}/s")
+            print(
+                f"latency p50={statistics.median(latencies) * 1000:.2f}ms "
+                f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms"
+            )
+            print(f"sold={sold} db_inventory={goods.inventory}")
+            if sold != min(stock, requests) or goods.inventory != stock - sold:
+                raise CommandError("inventory mismatch")
+        finally:
+            goods_id = goods.id
+            goods.delete()
+            inventory.redis_conn.hdel(inventory.PENDING_KEY, goods_id)
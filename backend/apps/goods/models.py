@@ -1,7 +1,11 @@
 import datetime
-from django.db.models import Q, F
+from functools import partial
+from django.db.models import Q
 from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from backend.settings import DB_PREFIX
+from backend.utils import goods_catalog, inventory
 from backend.utils.typed_model_meta import TypedModelMeta
 
 
@@ -36,15 +40,16 @@ class Goods(models.Model):
         if self.discount_time_end and self.sale_time_end:
             raise ValueError("折扣时间和限时时间不能同时启用")
 
-    def change_inventory(self, quantity: int):
-        with transaction.atomic():
-            Goods.objects.filter(id=self.id).update(inventory=F("inventory") - quantity)
-            self.refresh_from_db(fields=["inventory"])
-            if self.inventory < 0:
-                raise ValueError("库存不足")
-
     class Meta(TypedModelMeta):
         db_table = f"{DB_PREFIX}_goods"
         verbose_name = "商品表"
         verbose_name_plural = verbose_name
         ordering = ["sort", "-id"]
+
+
+@receiver(post_save, sender=Goods)
+@receiver(post_delete, sender=Goods)
+def goods_changed(instance: Goods, **kwargs):
+    # 商品变动, 清除商品列表缓存, 库存从数据库重新初始化
+    transaction.on_commit(goods_catalog.invalidate)
+    transaction.on_commit(partial(inventory.reset, instance.id))
@@ -1,3 +1,101 @@
+from unittest import mock, skipIf
+
 from django.test import TestCase
 
-# Create your tests here.
+from backend.utils import inventory
+from goods.models import Goods
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class InventoryTest(TestCase):
+    """redis 预扣库存, 在 fakeredis 上运行"""
+
+    def setUp(self):
+        redis_conn = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        for name, value in {
+            "redis_conn": redis_conn,
+            "reserve_script": redis_conn.register_script(inventory.RESERVE_SCRIPT),
+            "release_script": redis_conn.register_script(inventory.RELEASE_SCRIPT),
+        }.items():
+            patcher = mock.patch.object(inventory, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        inventory.sold_out_cache.clear()
+        self.goods = Goods.objects.create(
+            name="goods",
+            image="goods/test.png",
+            description="",
+            original_price=1,
+            discount_price=1,
+            inventory=5,
+            inventory_total=5,
+            status=True,
+        )
+
+    def get_stock(self):
+        return inventory.get_stock_many([self.goods.id])[self.goods.id]
+
+    def get_pending(self):
+        return int(inventory.redis_conn.hget(inventory.PENDING_KEY, self.goods.id) or 0)
+
+    def test_reserve(self):
+        self.assertIsNone(self.get_stock())
+        self.assertTrue(inventory.reserve(self.goods.id, 2))
+        self.assertEqual(self.get_stock(), 3)
+        self.assertEqual(self.get_pending(), 2)
+        # 库存不足时不扣减
+        self.assertFalse(inventory.reserve(self.goods.id, 4))
+        self.assertEqual(self.get_stock(), 3)
+        self.assertTrue(inventory.reserve(self.goods.id, 3))
+        self.assertEqual(self.get_stock(), 0)
+        self.assertFalse(inventory.reserve(self.goods.id, 1))
+        self.assertEqual(self.get_pending(), 5)
+
+    def test_reserve_missing_goods(self):
+        self.assertFalse(inventory.reserve(self.goods.id + 1, 1))
+
+    def test_init_stock_subtracts_pending(self):
+        inventory.redis_conn.hset(inventory.PENDING_KEY, self.goods.id, 2)
+        self.assertTrue(inventory.reserve(self.goods.id, 1))
+        self.assertEqual(self.get_stock(), 2)
+
+    def test_release(self):
+        self.assertTrue(inventory.reserve(self.goods.id, 5))
+        # 售罄缓存也要清除
+        self.assertFalse(inventory.reserve(self.goods.id, 1))
+        inventory.release(self.goods.id, 2)
+        self.assertEqual(self.get_stock(), 2)
+        self.assertEqual(self.get_pending(), 3)
+        self.assertTrue(inventory.reserve(self.goods.id, 2))
+
+    def test_release_after_reset(self):
+        self.assertTrue(inventory.reserve(self.goods.id, 2))
+        inventory.reset(self.goods.id)
+        inventory.release(self.goods.id, 2)
+        self.assertIsNone(self.get_stock())
+        self.assertEqual(self.get_pending(), 0)
+
+    def test_reconcile(self):
+        self.assertTrue(inventory.reserve(self.goods.id, 2))
+        self.assertTrue(inventory.reserve(self.goods.id, 1))
+        inventory.reconcile()
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.inventory, 2)
+        self.assertEqual(self.get_pending(), 0)
+        self.assertEqual(self.get_stock(), 2)
+        # 重新初始化后与数据库一致
+        inventory.reset(self.goods.id)
+        self.assertTrue(inventory.reserve(self.goods.id, 2))
+        self.assertFalse(inventory.reserve(self.goods.id, 1))
+
+    def test_reconcile_never_negative(self):
+        inventory.redis_conn.hset(inventory.PENDING_KEY, self.goods.id, 7)
+        inventory.reconcile()
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.inventory, 0)
+        self.assertEqual(self.get_pending(), 0)
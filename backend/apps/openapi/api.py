@@ -4,8 +4,9 @@ from django.http import HttpRequest
 from ninja import Form, Header, Query, Body, Router
 
 from backend.settings import REDIS_PREFIX, get_logger
+from backend.utils import openapp_registry
 from backend.utils.auth import auth_admin
-from backend.utils.response_types import Response
+from backend.utils.response_types import CursorPage, Response, cursor_page
 from openapi.models import OpenApp
 from user.models import User, UserCreditsLog
 
@@ -24,15 +25,15 @@ class OpenAppAuth(HttpBasicAuth):
         user_agent = request.headers.get("User-Agent", "")
         if "UnityPlayer" in user_agent:
             raise ValueError("接口应在服务器端调用")
-        user = OpenApp.objects.filter(app_id=username, app_secret=password).only("id").first()
-        if user is None:
+        app = openapp_registry.authenticate(app_id=username, app_secret=password)
+        if app is None:
             return None
-        return user.id
+        return app.id
 
 
-def get_login_openapp(request: HttpRequest):
+def get_login_openapp(request: HttpRequest) -> OpenApp:
     _id = getattr(request, "auth", None)
-    return OpenApp.objects.get(id=_id)
+    return openapp_registry.get_by_id(_id)
 
 
 @router.get("ping", auth=OpenAppAuth(), summary="测试")
@@ -87,10 +88,13 @@ def get_user_credits(
 def get_user_credits_list(
     request: HttpRequest,
     phone: str = Query(..., regex=r"^1[0-9]{10}$", description="手机号"),
-    page: int = Query(..., ge=1, description="页码"),
+    page: int = Query(1, ge=1, description="页码"),
     size: int = Query(..., ge=1, le=1000, description="每页数量"),
+    last_id: int | None = Query(None, ge=0, description="游标分页: 上一页返回的 next_id, 第一页传 0"),
+    with_total: bool = Query(False, description="游标分页: 是否返回总数"),
 ):
     """
+    传 last_id 时按游标分页, 返回 next_id(没有下一页时为 null), 不传时按页码分页
     data 数组 响应参数
     ```
     create_time: str 创建时间
@@ -103,13 +107,20 @@ def get_user_credits_list(
     app = get_login_openapp(request)
     user = User.objects.filter(phone=phone).first()
     if not user:
+        if last_id is not None:
+            return Response.cursor_list(data=[], page=CursorPage(object_list=[], next_id=None, total=0 if with_total else None))
         return Response.page_list(data=[], total=0, total_page=1)
 
     queryset = UserCreditsLog.objects.filter(user=user, app=app)
-    page_queryset = Paginator(queryset, size).page(page)
+    if last_id is not None:
+        page_queryset = cursor_page(queryset, size, last_id=last_id, with_total=with_total)
+        logs = page_queryset.object_list
+    else:
+        page_queryset = Paginator(queryset, size).page(page)
+        logs = page_queryset
 
     data = []
-    for i in page_queryset:
+    for i in logs:
         data.append(
             {
                 "create_time": i.create_time,
@@ -120,4 +131,6 @@ def get_user_credits_list(
             }
         )
 
+    if last_id is not None:
+        return Response.cursor_list(data=data, page=page_queryset)
     return Response.paginator_list(data=data, page=page_queryset)
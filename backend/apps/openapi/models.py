@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from typing import Literal
 from backend.settings import DB_PREFIX
+from backend.utils import openapp_registry
 from backend.utils.typed_model_meta import TypedModelMeta
 
 
@@ -17,3 +20,10 @@ class OpenApp(models.Model):
 
     def __str__(self) -> str:
         return self.name
+
+
+@receiver(post_save, sender=OpenApp)
+@receiver(post_delete, sender=OpenApp)
+def openapp_changed(instance: OpenApp, **kwargs):
+    # 应用变动, 各进程重新加载
+    transaction.on_commit(openapp_registry.invalidate)
@@ -1,4 +1,5 @@
 import datetime
+from functools import partial
 from django.contrib.auth.hashers import check_password, make_password
 from django.core.paginator import InvalidPage, Paginator
 from django.http import HttpRequest
@@ -6,11 +7,11 @@ from django.db.models import Q, F
 from django.db import transaction
 from ninja import Form, Header, Query, Body, Router
 
+from backend.utils import goods_catalog, inventory, openapp_registry, order_ticker
 from backend.utils.auth import auth
 from backend.settings import REDIS_PREFIX, get_logger
-from backend.utils.response_types import Response
+from backend.utils.response_types import Response, cursor_page
 from goods.models import Goods
-from openapi.models import OpenApp
 from user.models import User
 from order.models import Order
 from backend.utils.auth import auth
@@ -30,31 +31,51 @@ def post_order_create(
     if not user.can_express():
         return Response.error("未填写收货信息")
 
-    with transaction.atomic():
-        goods = Goods.objects.filter(id=goods_id).first()
-        if goods is None:
-            return Response.error("积分不足")
-        unit_price = goods.price
-        total_price = unit_price * quantity
-        order = Order.create(
-            user=user,
-            goods=goods,
-            unit_price=unit_price,
-            quantity=quantity,
-            total_price=total_price,
-            express_name=user.express_name,
-            express_phone=user.express_phone,
-            express_area=user.express_area,
-            express_address=user.express_address,
-        )
-        user.change_credits_and_log(
-            order_id=order.order_id,
-            operation=-1,
-            value=total_price,
-            channel="商城兑换",
-            app=OpenApp.objects.get(app_id="mall"),
-        )
-        goods.change_inventory(quantity=quantity)
+    # redis 预扣库存, 售罄或商品不存在时不查询商品
+    if not inventory.reserve(goods_id, quantity):
+        return Response.error("库存不足")
+    goods = Goods.objects.filter(id=goods_id).first()
+    if goods is None:
+        inventory.release(goods_id, quantity)
+        return Response.error("库存不足")
+
+    committed = False
+
+    def mark_committed():
+        nonlocal committed
+        committed = True
+
+    try:
+        with transaction.atomic():
+            unit_price = goods.price
+            total_price = unit_price * quantity
+            order = Order.create(
+                user=user,
+                goods=goods,
+                unit_price=unit_price,
+                quantity=quantity,
+                total_price=total_price,
+                express_name=user.express_name,
+                express_phone=user.express_phone,
+                express_area=user.express_area,
+                express_address=user.express_address,
+            )
+            user.change_credits_and_log(
+                order_id=order.order_id,
+                operation=-1,
+                value=total_price,
+                channel="商城兑换",
+                app=openapp_registry.get_by_app_id("mall"),
+            )
+            # 先于其他回调执行, 之后的回调异常时订单已提交, 不能归还库存
+            transaction.on_commit(mark_committed)
+            transaction.on_commit(inventory.schedule_reconcile)
+            transaction.on_commit(partial(order_ticker.push, order.id, goods.name, user.phone_mask))
+    except Exception:
+        if not committed:
+            inventory.release(goods.id, quantity)
+            raise
+        logger.exception(f"order {order.id} committed, on_commit hook failed")
 
     return Response.ok()
 
@@ -62,10 +83,13 @@ def post_order_create(
 @router.get("order/list", auth=auth.get_auth(), summary="订单列表")
 def get_order_list(
     request: HttpRequest,
-    page: int = Query(..., description="页码"),
+    page: int = Query(1, description="页码"),
     size: int = Query(..., description="每页数量"),
+    last_id: int | None = Query(None, description="游标分页: 上一页返回的 next_id, 第一页传 0"),
+    with_total: bool = Query(False, description="游标分页: 是否返回总数"),
 ):
     """
+    传 last_id 时按游标分页, 返回 next_id(没有下一页时为 null), 否则按页码分页
     ```
     id: int
     image: str
@@ -79,20 +103,31 @@ def get_order_list(
     user = auth.get_login_user(request)
     data = []
 
-    queryset = Order.objects.filter(user=user).order_by("-id")
-    page_queryset = Paginator(queryset, size).page(page)
-    for i in page_queryset:
+    # 只查询需要的字段, 商品信息从缓存批量获取
+    queryset = Order.objects.filter(user=user).order_by("-id").only("id", "goods_id", "create_time", "total_price", "quantity", "status")
+    if last_id is not None:
+        page_queryset = cursor_page(queryset, size, last_id=last_id, with_total=with_total)
+        orders = page_queryset.object_list
+    else:
+        page_queryset = Paginator(queryset, size).page(page)
+        orders = page_queryset
+    orders = list(orders)
+    goods = goods_catalog.get_goods_summaries({i.goods_id for i in orders})
+    for i in orders:
+        summary = goods.get(i.goods_id, {})
         data.append(
             {
                 "id": i.id,
-                "image": i.goods.image,
-                "name": i.goods.name,
+                "image": summary.get("image"),
+                "name": summary.get("name"),
                 "create_time": i.create_time.date(),
                 "total_price": i.total_price,
                 "quantity": i.quantity,
                 "status": i.status,
             }
         )
+    if last_id is not None:
+        return Response.cursor_list(data=data, page=page_queryset)
     return Response.paginator_list(data=data, page=page_queryset)
 
 
@@ -107,14 +142,4 @@ def get_global_order_list(
     phone: str
     ```
     """
-    data = []
-    queryset = Order.objects.order_by("-id").select_related("goods", "user").only("goods__name", "user__phone")[:10]
-    for i in queryset:
-        data.append(
-            {
-                "id": i.id,
-                "name": i.goods.name,
-                "phone": i.user.phone_mask,
-            }
-        )
-    return Response.list(data=data)
+    return Response.list(data=order_ticker.get_latest())
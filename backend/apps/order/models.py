@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 from backend.settings import DB_PREFIX
+from backend.utils import order_ticker
 from backend.utils.order_utils import get_goods_order_id
 from backend.utils.typed_model_meta import TypedModelMeta
 from goods.models import Goods
@@ -57,3 +60,9 @@ class Order(models.Model):
             express_area=express_area,
             express_address=express_address,
         )
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(instance: Order, **kwargs):
+    # 订单删除, 重建最新订单列表
+    transaction.on_commit(order_ticker.invalidate)
@@ -1,3 +1,59 @@
 from django.test import TestCase
 
-# Create your tests here.
+from backend.utils import goods_catalog
+from backend.utils.auth import auth
+from goods.models import Goods
+from order.models import Order
+from user.models import User
+
+
+class OrderListQueryCountTest(TestCase):
+    """订单列表的查询次数不随每页数量增长"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.get_or_create(phone="13800000000")
+        goods = [
+            Goods.objects.create(
+                name=f"goods{i}",
+                image="goods/test.png",
+                original_price=1,
+                discount_price=1,
+                inventory=10,
+                inventory_total=10,
+                status=True,
+            )
+            for i in range(4)
+        ]
+        Order.objects.bulk_create(
+            [Order(user=cls.user, goods=goods[i % 4], unit_price=1, quantity=1, total_price=1) for i in range(30)]
+        )
+
+    def setUp(self):
+        goods_catalog.summary_cache.clear()
+        self.token = auth.generate_token(self.user.phone)
+
+    def get_order_list(self, **params):
+        response = self.client.get("/api/order/list", params, HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]
+
+    def test_page(self):
+        # 第一次请求缓存商品摘要
+        self.get_order_list(page=1, size=5)
+        for size in (5, 20):
+            # 登录用户, 总数, 当前页
+            with self.assertNumQueries(3):
+                data = self.get_order_list(page=1, size=size)
+            self.assertEqual(len(data), size)
+            self.assertTrue(all(i["name"] for i in data))
+
+    def test_cursor(self):
+        # 第一次请求缓存商品摘要
+        self.get_order_list(last_id=0, size=5)
+        for size in (5, 20):
+            # 登录用户, 当前页
+            with self.assertNumQueries(2):
+                data = self.get_order_list(last_id=0, size=size)
+            self.assertEqual(len(data), size)
+            self.assertTrue(all(i["name"] for i in data))
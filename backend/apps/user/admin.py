@@ -6,6 +6,7 @@ from user.models import User, UserCreditsLog, WeiyiTreasureInfo
 class UserAdmin(admin.ModelAdmin):
     list_display = ("id", "phone", "credits")
     raw_id_fields = ("parent",)
+    readonly_fields = ("grandparent", "invited_count")
 
 @admin.register(UserCreditsLog)
 class UserCreditsLogAdmin(admin.ModelAdmin):
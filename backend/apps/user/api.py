@@ -6,19 +6,18 @@ from typing import Literal
 from django.core.paginator import Paginator
 from django.http import HttpRequest
 from django.http import HttpResponse
-from django.db import transaction
-from django.db.models import Sum
+from asgiref.sync import sync_to_async
 from ninja import Form, Header, Query, Body, Router
 
 from backend.utils.auth import auth
 from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+from backend.utils import job_queue, leaderboard, whitelist
 from backend.utils.hashid_utils import hashid_decode, hashid_encode
 from backend.utils.response_types import Response
-from backend.utils.user_level_update import do_update_user_level
-from backend.utils.weiyi.treasure_api import get_user_treasure
-from backend.utils.weiyi_rebate import do_rebate
-from user.models import User, UserCreditsLog, UserWeiyiTreasure, WeiyiTreasureInfo
-from backend.utils.weiyi import weiyi_client
+from backend.utils.weiyi_treasure_sync import async_sync_user_treasure
+from user.models import TreasureSyncResult, User
+from backend.utils.weiyi import async_weiyi_client, weiyi_client
+from backend.utils.weiyi.models import AccessTokenData, UserInfo
 from qrcode.image.pil import PilImage
 from qrcode.main import QRCode
 
@@ -75,8 +74,15 @@ def get_weiyi_oauth2_authorize(
     return Response.data({"url": url})
 
 
+def login_weiyi_user(token: AccessTokenData, user_info: UserInfo) -> str:
+    """保存唯艺登录状态, 返回登录token"""
+    user = User.get_or_create(phone=user_info.phone, avatar=user_info.avatar)
+    user.save_weiyi_token(token)
+    return auth.generate_token(user.phone)
+
+
 @router.get("weiyi/oauth2/callback", summary="weiyi oauth2 callback")
-def get_weiyi_oauth2_callback(
+async def get_weiyi_oauth2_callback(
     request: HttpRequest,
 ):
     """
@@ -90,12 +96,11 @@ def get_weiyi_oauth2_callback(
     if not code:
         return Response.error("缺少code")
 
-    token = weiyi_client.get_access_token(code)
-    user_info = weiyi_client.get_user_base_info(access_token=token.accessToken)
+    async with async_weiyi_client.http.scope():
+        token = await async_weiyi_client.get_access_token(code)
+        user_info = await async_weiyi_client.get_user_base_info(access_token=token.accessToken)
 
-    user = User.get_or_create(phone=user_info.phone, avatar=user_info.avatar)
-    user.save_weiyi_token(token)
-    token = auth.generate_token(user.phone)
+    token = await sync_to_async(login_weiyi_user)(token, user_info)
     return Response.data({"token": token})
 
 
@@ -138,36 +143,11 @@ def get_user_info(request: HttpRequest):
     """
     user = auth.get_login_user(request)
 
-    is_whitelist_key = f"shared:whitelist:{user.phone}"
-    is_whitelist_cache = redis_conn.get(is_whitelist_key)
-    if is_whitelist_cache:
-        is_whitelist = True
-    else:
-        is_whitelist = (
-            UserWeiyiTreasure.objects.filter(
-                commodity_uuid__in=WeiyiTreasureInfo.objects.filter(
-                    is_whitelist=True,
-                ).values_list("commodity_uuid")
-            )
-            .values_list("user", flat=True)
-            .filter(user=user)
-            .exists()
-        )
-        if is_whitelist:
-            redis_conn.set(is_whitelist_key, 1)
-
-    rank = User.objects.filter(level=user.level, credits__gte=user.credits).count()
-    total_income = (
-        UserCreditsLog.objects.filter(
-            user=user,
-            operation=1,
-        ).aggregate(
-            value__sum=Sum("value")
-        )["value__sum"]
-    ) or 0
-
-    invited_num = User.objects.filter(parent=user).count()
+    is_whitelist = whitelist.is_whitelisted(user.id)
 
+    rank = leaderboard.get_rank(user.level, user.credits)
+    if rank is None:
+        rank = User.objects.filter(level=user.level, credits__gte=user.credits).count()
     data = {
         "id": user.id,
         "phone": user.phone,
@@ -176,10 +156,10 @@ def get_user_info(request: HttpRequest):
         "is_whitelist": is_whitelist,
         "user_type": user.level,
         "rank": rank,
-        "total_income": total_income,
+        "total_income": user.total_income,
         "invite_parent": user.parent.phone_mask if user.parent else None,
         "be_invited_code": hashid_encode(user.parent.id) if user.parent else None,
-        "invited_num": invited_num,
+        "invited_num": user.invited_count,
         "invite_code": hashid_encode(user.id),
     }
     return Response.data(data)
@@ -209,8 +189,11 @@ def post_bind_parent(
 
     if parent_user.level == User.LevelChoice.A and user.level == User.LevelChoice.C:
         user.level = User.LevelChoice.B
-    user.parent = parent_user
-    user.save(update_fields=["parent", "level"])
+    if not user.bind_parent(parent_user):
+        return Response.error("已绑定邀请人")
+    # 绑定已提交, 从数据库重新读取积分, 请求开始时读取的积分可能已被并发修改
+    leaderboard.sync_users([user.id])
+    job_queue.enqueue("backend.utils.user_level_update.update_users_level", user_ids=[user.id])
     return Response.ok()
 
 
@@ -274,46 +257,57 @@ def get_user_credits_ranking_all(request: HttpRequest):
     ```
     """
     levels = [User.LevelChoice.A, User.LevelChoice.B, User.LevelChoice.C]
-    querysets = [User.objects.filter(level=level).order_by("-credits")[:10] for level in levels]
-    datas = [
-        [
-            {
-                "id": i.id,
-                "phone": i.phone_mask,
-                "credits": i.credits,
-            }
-            for i in queryset
+    if leaderboard.is_ready():
+        tops = [leaderboard.get_top(level, 10) for level in levels]
+        users = User.objects.filter(id__in=[user_id for top in tops for user_id, _ in top]).only("id", "phone").in_bulk()
+        datas = [
+            [
+                {
+                    "id": user_id,
+                    "phone": users[user_id].phone_mask,
+                    "credits": credits,
+                }
+                for user_id, credits in top
+                if user_id in users
+            ]
+            for top in tops
+        ]
+    else:
+        querysets = [User.objects.filter(level=level).order_by("-credits")[:10] for level in levels]
+        datas = [
+            [
+                {
+                    "id": i.id,
+                    "phone": i.phone_mask,
+                    "credits": i.credits,
+                }
+                for i in queryset
+            ]
+            for queryset in querysets
         ]
-        for queryset in querysets
-    ]
     data: dict = dict(zip(levels, datas))
     data["update_time"] = datetime.datetime.now().date()
     return Response.data(data)
 
 
+def after_weiyi_sync(user: User, result: TreasureSyncResult):
+    """藏品同步后刷新白名单, 异步返利和更新等级"""
+    whitelist.refresh_users([user.id, *result.previous_user_ids])
+
+    if result.created:
+        job_queue.enqueue("backend.utils.weiyi_rebate.do_rebate")
+    job_queue.enqueue("backend.utils.user_level_update.update_users_level", user_ids=[user.id])
+
+
 @router.post("user/weiyi/check", auth=auth.get_auth(), summary="唯艺藏品同步")
-def post_user_weiyi_check(
+async def post_user_weiyi_check(
     request: HttpRequest,
 ):
-    user = auth.get_login_user(request)
-    treasures = get_user_treasure(user.phone)
-    logger.info(f"treasures {len(treasures)}")
-    has_created = False
-    with transaction.atomic():
-        for i in treasures:
-            _, created = UserWeiyiTreasure.update_or_create(
-                user=user,
-                commodity_uuid=i.commodityUuid,
-                number=i.number,
-                name=i.name,
-                cover=i.cover,
-                type_market=i.typeMarket,
-            )
-            if created:
-                has_created = True
-
-    if has_created:
-        do_rebate()
-    do_update_user_level()
+    user = await sync_to_async(auth.get_login_user)(request)
+    result = await async_sync_user_treasure(user)
+    if result is None:
+        # 冷却时间内重复同步
+        return Response.ok()
+    await sync_to_async(after_weiyi_sync)(user, result)
 
     return Response.ok()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from backend.utils.weiyi_rebate import REBATE_CHUNK_SIZE, do_rebate
+
+
+class Command(BaseCommand):
+    help = "Pay pending Weiyi treasure rebates in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=REBATE_CHUNK_SIZE,
+            help="treasures per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="compute payouts without writing",
+        )
+
+    def handle(self, *args, **options):
+        summary = do_rebate(chunk_size=options["chunk_size"], dry_run=options["dry_run"])
+        print(summary)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.utils import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rebuild credits leaderboard from database"
+
+    def handle(self, *args, **options):
+        leaderboard.rebuild()
+        for level in leaderboard.leaderboard_levels():
+            print(level, leaderboard.get_top(level, 3))
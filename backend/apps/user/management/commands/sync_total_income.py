@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from user.models import User, UserCreditsLog
+
+
+class Command(BaseCommand):
+    help = "Backfill or verify User.total_income from UserCreditsLog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            default=False,
+            help="only report mismatches, do not write",
+        )
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+
+        incomes = dict(
+            UserCreditsLog.objects.filter(operation=UserCreditsLog.OperationChoice.INCREASE)
+            .values("user")
+            .annotate(value_sum=Sum("value"))
+            .values_list("user", "value_sum")
+            .order_by()
+        )
+        mismatches = []
+        for user_id, total_income in User.objects.values_list("id", "total_income").order_by("id").iterator():
+            expected = incomes.get(user_id) or 0
+            if total_income != expected:
+                mismatches.append((user_id, total_income, expected))
+
+        for user_id, total_income, expected in mismatches:
+            print(f"user={user_id} total_income={total_income} expected={expected}")
+            if not verify:
+                User.objects.filter(id=user_id).update(total_income=expected)
+
+        print(f"mismatches: {len(mismatches)}")
+        if verify and mismatches:
+            raise CommandError("total_income mismatch")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from backend.utils.user_level_update import do_update_user_level
+
+
+class Command(BaseCommand):
+    help = "Recompute all user levels (periodic reconciliation of incremental updates)"
+
+    def handle(self, *args, **options):
+        do_update_user_level()
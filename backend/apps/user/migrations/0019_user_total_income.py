@@ -0,0 +1,30 @@
+# Generated by Django 3.2.22 on 2023-11-10 10:12
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_total_income(apps, schema_editor):
+    # 与 sync_total_income 命令一致: 所有增加记录之和
+    User = apps.get_model("user", "User")
+    UserCreditsLog = apps.get_model("user", "UserCreditsLog")
+
+    incomes = UserCreditsLog.objects.filter(operation=1).values("user").annotate(value_sum=Sum("value")).order_by()
+    for row in incomes:
+        User.objects.filter(id=row["user"]).update(total_income=row["value_sum"] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0018_auto_20231109_1918'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='total_income',
+            field=models.BigIntegerField(default=0, verbose_name='总收入'),
+        ),
+        migrations.RunPython(backfill_total_income, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.22 on 2023-11-10 11:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def backfill_invite_tree(apps, schema_editor):
+    User = apps.get_model("user", "User")
+
+    invited_counts = User.objects.filter(parent__isnull=False).values("parent").annotate(count=Count("id")).order_by()
+    for row in invited_counts:
+        User.objects.filter(id=row["parent"]).update(invited_count=row["count"])
+
+    parents = dict(User.objects.filter(parent__isnull=False).values_list("id", "parent"))
+    grandparents = defaultdict(list)
+    for user_id, parent_id in parents.items():
+        grandparent_id = parents.get(parent_id)
+        if grandparent_id:
+            grandparents[grandparent_id].append(user_id)
+    for grandparent_id, user_ids in grandparents.items():
+        User.objects.filter(id__in=user_ids).update(grandparent_id=grandparent_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0019_user_total_income'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='grandparent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='user.user', verbose_name='上上级邀请人'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='invited_count',
+            field=models.IntegerField(default=0, verbose_name='邀请人数'),
+        ),
+        migrations.RunPython(backfill_invite_tree, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.22 on 2023-11-10 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0020_user_invite_tree'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userweiyitreasure',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='user.user', verbose_name='用户'),
+        ),
+        migrations.CreateModel(
+            name='UserWeiyiTreasureSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sync_time', models.DateTimeField(blank=True, default=None, null=True, verbose_name='上次同步时间')),
+                ('total_count', models.IntegerField(default=0, verbose_name='藏品总数')),
+                ('page_hashes', models.JSONField(blank=True, default=dict, verbose_name='分页内容哈希')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='user.user', verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户唯艺藏品同步状态',
+                'verbose_name_plural': '用户唯艺藏品同步状态',
+                'db_table': 'cmp_user_weiyi_treasure_sync',
+            },
+        ),
+    ]
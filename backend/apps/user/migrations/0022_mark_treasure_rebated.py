@@ -0,0 +1,20 @@
+# Generated by Django 3.2.22 on 2023-11-10 15:02
+
+from django.db import migrations
+
+
+def mark_treasure_rebated(apps, schema_editor):
+    # 旧版返利从未标记 is_rebate, 已有藏品都已发放过返利, 避免上线后重复发放
+    UserWeiyiTreasure = apps.get_model("user", "UserWeiyiTreasure")
+    UserWeiyiTreasure.objects.filter(is_rebate=False).update(is_rebate=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0021_auto_20231110_1420'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_treasure_rebated, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,27 @@
 import datetime
+from functools import partial
 from django.db import models, transaction
 from django.db.models import F
-from typing import TYPE_CHECKING, Literal, TypedDict
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from typing import TYPE_CHECKING, Iterable, Literal, NamedTuple, Set, TypedDict
 from backend.settings import DB_PREFIX
+from backend.utils import job_queue, leaderboard, weiyi_token, whitelist
 from backend.utils.typed_model_meta import TypedModelMeta
 from openapi.models import OpenApp
 
 from backend.utils.weiyi.models import AccessTokenData, UserCollectionListData, UserInfo
 from backend.utils.weiyi import weiyi_client
-from ninja.errors import AuthenticationError
+from backend.utils.weiyi.treasure_api import TreasureDetail
 
 
 class WeiyiClientUser:
     def __init__(self, user: "User"):
         self.user = user
-        if not self.user.weiyi_token:
-            raise AuthenticationError()
-        self.token = AccessTokenData.parse_obj(self.user.weiyi_token)
 
     def __get_access_token(self):
-        now = datetime.datetime.now()
-        expire_at = self.user.weiyi_token_expire_at or now
-        ttl = (expire_at - now).total_seconds()
-
-        if ttl <= 30:
-            self.token = weiyi_client.refresh_token(self.token.refreshToken)
-            self.user.save_weiyi_token(self.token)
-
-        return self.token.accessToken
+        # 优先读取 redis, 需要刷新时同一用户只刷新一次
+        return weiyi_token.get_access_token(self.user.id)
 
     def get_user_base_info(self) -> UserInfo:
         return weiyi_client.get_user_base_info(
@@ -42,6 +36,10 @@ class WeiyiClientUser:
         )
 
 
+# 累计收入达到该值时 C 升级为 B
+LEVEL_C_TO_B_TOTAL_INCOME = 100000
+
+
 if TYPE_CHECKING:
     UserSelfForeignKey = models.ForeignKey["User" | None]
 else:
@@ -58,10 +56,16 @@ class User(models.Model):
     parent: UserSelfForeignKey = models.ForeignKey(
         "self", null=True, blank=True, on_delete=models.SET_NULL, verbose_name="邀请人"
     )
+    # 邀请人的邀请人, 绑定邀请人时维护
+    grandparent: UserSelfForeignKey = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.SET_NULL, related_name="+", verbose_name="上上级邀请人"
+    )
+    invited_count = models.IntegerField(default=0, verbose_name="邀请人数")
     create_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     phone = models.CharField(max_length=150, unique=True, verbose_name="手机号")
     avatar = models.CharField(max_length=150, default=None, null=True, blank=True, verbose_name="头像")
     credits = models.BigIntegerField(default=0, verbose_name="积分")
+    total_income = models.BigIntegerField(default=0, verbose_name="总收入")
 
     weiyi_token = models.JSONField(default=None, null=True, blank=True, verbose_name="唯艺登录状态")
     weiyi_token_expire_at = models.DateTimeField(
@@ -80,7 +84,7 @@ class User(models.Model):
     def parent_parent(self):
         if self.parent is None:
             return None
-        return self.parent.parent
+        return self.grandparent
 
     @property
     def parent_parent_level(self):
@@ -109,15 +113,34 @@ class User(models.Model):
         self.weiyi_token = token.dict()
         self.weiyi_token_expire_at = datetime.datetime.now() + datetime.timedelta(seconds=token.expires)
         self.save(update_fields=["weiyi_token", "weiyi_token_expire_at"])
+        transaction.on_commit(partial(weiyi_token.cache_access_token, self.id, token, self.weiyi_token_expire_at))
 
     @classmethod
     def get_or_create(cls, phone: str, avatar: str | None = None):
-        user, _ = cls.objects.get_or_create(phone=phone)
+        user, created = cls.objects.get_or_create(phone=phone)
+        if created:
+            leaderboard.update_score(user.id, user.level, user.credits)
         if avatar and user.avatar != avatar:
             user.avatar = avatar
             user.save(update_fields=["avatar"])
         return user
 
+    def bind_parent(self, parent: "User") -> bool:
+        """绑定邀请人, 同时维护邀请人数和上上级, 已绑定时返回 False"""
+        with transaction.atomic():
+            # 条件更新, 并发绑定时只有一个成功, 邀请人数只增加一次
+            updated = User.objects.filter(id=self.id, parent__isnull=True).update(
+                parent=parent, grandparent_id=parent.parent_id, level=self.level
+            )
+            if updated != 1:
+                return False
+            self.parent = parent
+            self.grandparent_id = parent.parent_id
+            User.objects.filter(id=parent.id).update(invited_count=F("invited_count") + 1)
+            # 已经邀请的下级, 上上级变为新绑定的邀请人
+            User.objects.filter(parent=self).update(grandparent=parent)
+        return True
+
     def can_express(self) -> bool:
         return all(
             [
@@ -140,9 +163,12 @@ class User(models.Model):
         if order_exist:
             raise ValueError("订单号重复")
         value = abs(value)
+        changes = {"credits": F("credits") + (operation * value)}
+        if operation == UserCreditsLog.OperationChoice.INCREASE:
+            changes["total_income"] = F("total_income") + value
         with transaction.atomic():
-            User.objects.select_for_update().filter(id=self.id).update(credits=F("credits") + (operation * value))
-            self.refresh_from_db(fields=["credits"])
+            User.objects.select_for_update().filter(id=self.id).update(**changes)
+            self.refresh_from_db(fields=["credits", "total_income", "level"])
             if self.credits < 0:
                 raise ValueError("积分不足")
             UserCreditsLog.create(
@@ -153,6 +179,12 @@ class User(models.Model):
                 channel=channel,
                 app=app,
             )
+            # 提交后重新读取积分, 并发提交的回调顺序不确定, 不能使用事务内的值
+            transaction.on_commit(partial(leaderboard.sync_users, [self.id]))
+            if self.level == User.LevelChoice.C and self.total_income >= LEVEL_C_TO_B_TOTAL_INCOME:
+                transaction.on_commit(
+                    partial(job_queue.enqueue, "backend.utils.user_level_update.update_users_level", user_ids=[self.id])
+                )
 
     class Meta(TypedModelMeta):
         db_table = f"{DB_PREFIX}_user"
@@ -219,6 +251,13 @@ class WeiyiTreasureInfo(models.Model):
         verbose_name_plural = verbose_name
 
 
+@receiver(post_save, sender=WeiyiTreasureInfo)
+@receiver(post_delete, sender=WeiyiTreasureInfo)
+def weiyi_treasure_info_changed(instance: WeiyiTreasureInfo, **kwargs):
+    # 白名单藏品变动, 重建白名单集合
+    transaction.on_commit(whitelist.invalidate)
+
+
 class UserWeiyiTreasure(models.Model):
     class TypeMarketChoice(models.IntegerChoices):
         copyright = 1, "版权品"
@@ -226,7 +265,8 @@ class UserWeiyiTreasure(models.Model):
         digital_identity = 3, "数字身份"
 
     create_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="用户")
+    # 同步时发现已不在持有人名下则置空
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, verbose_name="用户")
     commodity_uuid = models.CharField(max_length=150, verbose_name="商品唯一标识")
     name = models.CharField(max_length=150, verbose_name="商品名")
     number = models.IntegerField(verbose_name="编号")
@@ -244,36 +284,77 @@ class UserWeiyiTreasure(models.Model):
         index_together = [["name", "number"]]
 
     @classmethod
-    def update_or_create(
-        cls,
-        # unique
-        commodity_uuid: str,
-        number: int,
-        # defaults
-        user: User,
-        name: str,
-        cover: str,
-        type_market: int,
-    ):
-        defaults = {
-            "user": user,
-            "name": name,
-            "cover": cover,
-            "type_market": type_market,
+    def bulk_sync(cls, user: User, treasures: Iterable[TreasureDetail]) -> "TreasureSyncResult":
+        """批量同步用户藏品, 一次查询已有记录, 只写入新增和变动的记录"""
+        items = {(i.commodityUuid, i.number): i for i in treasures}
+        if not items:
+            return TreasureSyncResult(created=0, updated=0, unchanged=0, previous_user_ids=set())
+
+        existing = {
+            (obj.commodity_uuid, obj.number): obj
+            for obj in cls.objects.filter(
+                commodity_uuid__in={commodity_uuid for commodity_uuid, _ in items},
+                number__in={number for _, number in items},
+            ).only("id", "commodity_uuid", "number", "user_id", "name", "cover", "type_market")
         }
-        with transaction.atomic():
-            obj, created = UserWeiyiTreasure.objects.select_for_update().get_or_create(
-                commodity_uuid=commodity_uuid,
-                number=number,
-                defaults=defaults,
-            )
-            if created:
-                return obj, True
 
-            update_fields = []
+        to_create: list[UserWeiyiTreasure] = []
+        to_update: list[UserWeiyiTreasure] = []
+        previous_user_ids: Set[int] = set()
+        for (commodity_uuid, number), i in items.items():
+            defaults = {
+                "user_id": user.id,
+                "name": i.name,
+                "cover": i.cover,
+                "type_market": i.typeMarket,
+            }
+            obj = existing.get((commodity_uuid, number))
+            if obj is None:
+                to_create.append(cls(commodity_uuid=commodity_uuid, number=number, **defaults))
+                continue
+            if obj.user_id is not None and obj.user_id != user.id:
+                previous_user_ids.add(obj.user_id)
+            changed = False
             for k, v in defaults.items():
                 if getattr(obj, k) != v:
                     setattr(obj, k, v)
-                    update_fields.append(k)
-            obj.save(update_fields=defaults)
-            return obj, False
+                    changed = True
+            if changed:
+                to_update.append(obj)
+
+        if to_create or to_update:
+            with transaction.atomic():
+                if to_create:
+                    cls.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+                if to_update:
+                    cls.objects.bulk_update(to_update, fields=["user", "name", "cover", "type_market"], batch_size=500)
+
+        return TreasureSyncResult(
+            created=len(to_create),
+            updated=len(to_update),
+            unchanged=len(items) - len(to_create) - len(to_update),
+            previous_user_ids=previous_user_ids,
+        )
+
+
+class TreasureSyncResult(NamedTuple):
+    created: int
+    updated: int
+    unchanged: int
+    # 藏品转移前的持有人
+    previous_user_ids: Set[int]
+    # 已不在用户名下被置空的数量
+    removed: int = 0
+
+
+class UserWeiyiTreasureSync(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="用户")
+    sync_time = models.DateTimeField(default=None, null=True, blank=True, verbose_name="上次同步时间")
+    total_count = models.IntegerField(default=0, verbose_name="藏品总数")
+    # {页码: 内容哈希}, 内容未变的页跳过写入
+    page_hashes = models.JSONField(default=dict, blank=True, verbose_name="分页内容哈希")
+
+    class Meta(TypedModelMeta):
+        db_table = f"{DB_PREFIX}_user_weiyi_treasure_sync"
+        verbose_name = "用户唯艺藏品同步状态"
+        verbose_name_plural = verbose_name
@@ -1,3 +1,97 @@
+from collections import Counter
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.db import transaction
 from django.test import TestCase
 
-# Create your tests here.
+from backend.utils import openapp_registry, weiyi_rebate
+from openapi.models import OpenApp
+from user.models import User, UserCreditsLog, UserWeiyiTreasure, WeiyiTreasureInfo
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RebateTest(TestCase):
+    """批量返利与逐条调用 change_credits_and_log 的结果一致"""
+
+    def setUp(self):
+        redis_conn = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        for module in (weiyi_rebate, openapp_registry):
+            patcher = mock.patch.object(module, "redis_conn", redis_conn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        openapp_registry.registry.clear()
+        OpenApp.objects.create(name="mall", app_id="mall", app_secret="mall")
+
+        def create_user(phone: str, level: str, parent: User | None = None) -> User:
+            user = User.objects.create(phone=phone, level=level, credits=100, total_income=50)
+            if parent is not None:
+                user.bind_parent(parent)
+            return user
+
+        a = create_user("13800000001", User.LevelChoice.A)
+        b = create_user("13800000002", User.LevelChoice.B, a)
+        c1 = create_user("13800000003", User.LevelChoice.C, b)
+        c2 = create_user("13800000004", User.LevelChoice.C, c1)
+        c3 = create_user("13800000005", User.LevelChoice.C)
+        self.users = [a, b, c1, c2, c3]
+
+        WeiyiTreasureInfo.objects.create(commodity_uuid="x", name="x", price=Decimal("1.5"))
+        WeiyiTreasureInfo.objects.create(commodity_uuid="y", name="y", price=Decimal("3"))
+        number = 0
+        for user, commodity_uuids in [(b, "x"), (c1, "xy"), (c2, "xyy"), (c3, "y"), (None, "x")]:
+            for commodity_uuid in commodity_uuids:
+                number += 1
+                UserWeiyiTreasure.objects.create(
+                    user=user, commodity_uuid=commodity_uuid, name=commodity_uuid, number=number, cover="", type_market=1
+                )
+        # 无价格的藏品不返利
+        UserWeiyiTreasure.objects.create(user=c1, commodity_uuid="z", name="z", number=100, cover="", type_market=1)
+
+    def snapshot(self):
+        users = {i.id: (i.credits, i.total_income) for i in User.objects.filter(id__in=[i.id for i in self.users])}
+        logs = Counter(
+            UserCreditsLog.objects.values_list("user_id", "operation", "value", "channel", "app__app_id")
+        )
+        return users, logs
+
+    def rebate_per_row(self):
+        """改为批量前的逐条返利"""
+        infos = {i.commodity_uuid: i for i in WeiyiTreasureInfo.objects.all()}
+        treasures = UserWeiyiTreasure.objects.filter(is_rebate=False, user__isnull=False, commodity_uuid__in=infos)
+        for i in treasures.select_related("user__parent", "user__grandparent").order_by("id"):
+            for payout in weiyi_rebate.compute_rebate(user=i.user, info=infos[i.commodity_uuid]):
+                payout.user.change_credits_and_log(
+                    order_id=weiyi_rebate.get_order_id(),
+                    operation=1,
+                    value=payout.value,
+                    channel="返利",
+                    app=openapp_registry.get_by_app_id("mall"),
+                )
+
+    def test_batch_matches_per_row(self):
+        with transaction.atomic():
+            self.rebate_per_row()
+            expected = self.snapshot()
+            transaction.set_rollback(True)
+
+        summary = weiyi_rebate.do_rebate(chunk_size=2)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(summary["payouts"], sum(expected[1].values()))
+        self.assertGreater(summary["value"], 0)
+        self.assertFalse(UserWeiyiTreasure.objects.filter(user__isnull=False, commodity_uuid__in=["x", "y"], is_rebate=False).exists())
+
+        # 再次执行不重复返利
+        weiyi_rebate.do_rebate()
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_dry_run(self):
+        before = self.snapshot()
+        summary = weiyi_rebate.do_rebate(dry_run=True)
+        self.assertGreater(summary["payouts"], 0)
+        self.assertEqual(self.snapshot(), before)
@@ -67,6 +67,7 @@ UWSGI_INI_FILE_NAME = DOMAIN_NAME  # uwsgi配置文件名
 CRONTAB_COMMENT = "cmp"  # django-crontab 注释, 区分不同项目
 DB_PREFIX = "cmp"  # 数据库表名前缀
 REDIS_PREFIX = "cmp"  # redis前缀
+JOB_QUEUE_EAGER = False  # 后台任务直接在请求中执行, 不需要运行 python manage.py run_jobs
 DEFAULT_AVATAR = urljoin(BASE_URL, "media/default_avatar.svg")
 DEFAULT_AVATAR_BACK = urljoin(BASE_URL, "media/default_avatar.svg")
 
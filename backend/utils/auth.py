@@ -8,6 +8,7 @@ auth_admin = AuthBearerHelper(
     user_model=AdminUser,
     project_name=REDIS_PREFIX,
     cache_token_expires=12 * 60 * 60,
+    stateless=True,
 )
 # 前端登录验证
 auth = AuthSessionHelper(
@@ -1,13 +1,16 @@
+import copy
 import logging
 import time
-from typing import Any, Callable, Generic, Optional, TYPE_CHECKING, cast
+from typing import Any, Callable, Dict, Generic, Optional, TYPE_CHECKING, cast
 import uuid
 import jwt
 from django.conf import settings
 from django.db.models.base import Model
+from django.db.models.signals import post_delete, post_save
 
 from django.http.request import HttpRequest
 from backend.settings import get_redis_connection
+from backend.utils.local_cache import MISSING, TTLCache
 from jwt.exceptions import InvalidTokenError
 from ninja.errors import AuthenticationError
 from ninja.security import HttpBearer
@@ -36,6 +39,8 @@ class AuthBearerHelper(Generic[_T]):
         cache_token_expires: int = 12 * 60 * 60,
         redis_conn: Redis = get_redis_connection(),
         secret_key: str = settings.SECRET_KEY,
+        stateless: bool = False,
+        version_refresh_interval: int = 5,
     ):
         """
         user_model: 用户模型
@@ -43,12 +48,20 @@ class AuthBearerHelper(Generic[_T]):
         cache_token_expires: 缓存token的过期时间(秒)
         redis_conn: redis连接
         secret_key: jwt加密的密钥
+        stateless: 无状态模式, token自带过期时间和会话版本, 验证时只读取进程内缓存的版本号, 不写redis
+        version_refresh_interval: 无状态模式下进程内版本号的刷新间隔(秒), 即注销后token最多还能继续使用的时间
         """
         self.user_model = user_model
         self.cache_token_key = f"{project_name}:{user_model.__name__}:token:"
+        self.cache_token_version_key = f"{project_name}:{user_model.__name__}:token_version"
         self.cache_token_expires = cache_token_expires
         self.secret_key = secret_key
         self.redis_conn = redis_conn
+        self.stateless = stateless
+        self.version_refresh_interval = version_refresh_interval
+        # user_id -> 会话版本
+        self.token_versions: Dict[str, int] = {}
+        self.token_versions_refresh_at = 0.0
         self.auth = AuthBearer(authenticate=self.authenticate)
 
     def set_token(self, user_id: int, token: str):
@@ -68,6 +81,31 @@ class AuthBearerHelper(Generic[_T]):
         """检查token"""
         return self.get_token(user_id) == token
 
+    def get_token_version(self, user_id: int, min_version: int = 0) -> int:
+        """
+        获取会话版本(进程内缓存, 定时从redis刷新)
+        min_version: 缓存的版本低于该值时立即读取redis, 版本只增不减, 说明其他进程已重新登录
+        """
+        now = time.monotonic()
+        if now >= self.token_versions_refresh_at:
+            versions = self.redis_conn.hgetall(self.cache_token_version_key)
+            self.token_versions = {(k.decode() if isinstance(k, bytes) else str(k)): int(v) for k, v in versions.items()}
+            self.token_versions_refresh_at = now + self.version_refresh_interval
+        version = self.token_versions.get(str(user_id), 0)
+        if version < min_version:
+            version = int(self.redis_conn.hget(self.cache_token_version_key, str(user_id)) or 0)
+            self.token_versions[str(user_id)] = version
+        return version
+
+    def revoke_token(self, user_id: int) -> int:
+        """注销用户所有token, 返回新的会话版本"""
+        if not self.stateless:
+            self.redis_conn.delete(self.cache_token_key + str(user_id))
+            return 0
+        version = int(self.redis_conn.hincrby(self.cache_token_version_key, str(user_id), 1))
+        self.token_versions[str(user_id)] = version
+        return version
+
     def get_login_uid_optional(self, request: HttpRequest) -> Optional[int]:
         """可选获取登录用户id, 未登录返回 None"""
         return self.auth(request)
@@ -114,10 +152,15 @@ class AuthBearerHelper(Generic[_T]):
             "user_id": user_id,
             "iat": timestamp,
         }
+        if self.stateless:
+            # 登录后旧token失效
+            payload["exp"] = timestamp + self.cache_token_expires
+            payload["ver"] = self.revoke_token(user_id)
         token = jwt.encode(payload, self.secret_key, algorithm="HS256")
         if isinstance(token, bytes):
             token = token.decode()
-        self.set_token(user_id, token)
+        if not self.stateless:
+            self.set_token(user_id, token)
         return token
 
     def decode_token(self, token: str):
@@ -131,6 +174,12 @@ class AuthBearerHelper(Generic[_T]):
     def authenticate(self, request: HttpRequest, token: str):
         data = self.decode_token(token)
         user_id = data.get("user_id", 0)
+        if self.stateless:
+            # 过期时间已由jwt校验
+            version = data.get("ver")
+            if version is not None and version == self.get_token_version(user_id, min_version=version):
+                return user_id
+            return None
         if self.token_check(user_id, token):
             # 续期
             self.set_token(user_id, token)
@@ -143,36 +192,108 @@ class AuthBearerHelper(Generic[_T]):
         return self.auth
 
 
+# 一次往返完成 token 查询和续期
+# KEYS[1]: token key
+# ARGV[1]: 剩余时间低于该值时续期(秒), 0 为不续期
+# ARGV[2]: 续期后的过期时间(秒)
+TOKEN_LOAD_AND_RENEWAL_SCRIPT = """
+local value = redis.call("GET", KEYS[1])
+local threshold = tonumber(ARGV[1])
+if value and threshold > 0 then
+    local ttl = redis.call("TTL", KEYS[1])
+    if ttl < threshold then
+        redis.call("EXPIRE", KEYS[1], ARGV[2])
+    end
+end
+return value
+"""
+
+
 class AuthSessionHelper(Generic[_T]):
     def __init__(
         self,
         user_model: Type[_T],
         cache_token_expires: int = 30 * 24 * 60 * 60,
         redis_conn: Redis = get_redis_connection(),
+        local_cache_size: int = 10000,
+        local_cache_ttl: int = 10,
+        user_cache_ttl: int = 0,
+        user_select_related: tuple = ("parent",),
+        renewal_threshold: int = 7 * 60 * 60,
+        renewal_interval: int = 10 * 60,
     ):
         """
         user_model: 用户模型
         cache_token_expires: 缓存token的过期时间(秒)
         redis_conn: redis连接
+        local_cache_size: 进程内token缓存条数
+        local_cache_ttl: 进程内token缓存时间(秒), 即token失效后其他worker最多还能继续使用的时间, 0 为不缓存
+        user_cache_ttl: 进程内用户缓存时间(秒), 本进程内 save() 时失效, 0 为不缓存
+        user_select_related: 获取登录用户时一并查询的外键
+        renewal_threshold: token剩余时间低于该值时续期(秒)
+        renewal_interval: 同一token两次续期检查的最小间隔(秒)
         """
         self.user_model = user_model
         self.cache_token_key = f"shared:token:"
         self.cache_token_expires = cache_token_expires
         self.redis_conn = redis_conn
+        self.renewal_threshold = renewal_threshold
+        self.load_token_script = redis_conn.register_script(TOKEN_LOAD_AND_RENEWAL_SCRIPT)
+        # 最近检查过续期的token
+        self.renewal_cache: TTLCache[str, bool] = TTLCache(maxsize=local_cache_size, ttl=renewal_interval)
+        # token -> phone, 无效token缓存为 None
+        self.token_cache: TTLCache[str, Optional[str]] = TTLCache(maxsize=local_cache_size, ttl=local_cache_ttl)
+        self.user_select_related = user_select_related
+        # phone -> user
+        self.user_cache: TTLCache[str, _T] = TTLCache(maxsize=local_cache_size, ttl=user_cache_ttl)
+        if user_cache_ttl > 0:
+            post_save.connect(self.invalidate_user_cache, sender=user_model, weak=False)
+            post_delete.connect(self.invalidate_user_cache, sender=user_model, weak=False)
         self.auth = AuthBearer(authenticate=self.authenticate)
 
+    def invalidate_user_cache(self, instance: _T, **kwargs):
+        """用户保存/删除时清除进程内用户缓存"""
+        phone = getattr(instance, "phone", None)
+        if phone:
+            self.user_cache.delete(phone)
+
+    def get_user_by_phone(self, phone) -> Optional[_T]:
+        """按手机号获取用户, 预加载 user_select_related"""
+        if not phone:
+            return None
+        user = self.user_cache.get(phone)
+        if user is None:
+            user = self.user_model.objects.select_related(*self.user_select_related).filter(phone=phone).first()
+            if user is None:
+                return None
+            self.user_cache.set(phone, user)
+        # 缓存的实例在请求间共享, 返回副本避免修改互相影响
+        if self.user_cache.ttl > 0:
+            user = copy.copy(user)
+        if TYPE_CHECKING:
+            user = cast(_T, user)
+        return user
+
+    def _get_request_user(self, request: HttpRequest, phone) -> Optional[_T]:
+        """同一请求内只查询一次登录用户"""
+        user = getattr(request, "_login_user", None)
+        if user is None or getattr(user, "phone", None) != phone:
+            user = self.get_user_by_phone(phone)
+            setattr(request, "_login_user", user)
+        return user
+
     def set_token(self, phone: str, token: str):
         """设置token"""
         key = self.cache_token_key + token
         value = f"weiyi:{phone}"
         self.redis_conn.set(name=key, value=value, ex=self.cache_token_expires)
+        self.token_cache.set(token, phone)
 
-    def token_renewal(self, token: str, phone: str):
-        """token续期"""
+    def revoke_token(self, token: str):
+        """注销token, 其他worker的进程内缓存最多 local_cache_ttl 秒后失效"""
         key = self.cache_token_key + token
-        ttl = self.redis_conn.ttl(key)
-        if ttl < 7 * 60 * 60:
-            self.set_token(phone=phone, token=token)
+        self.redis_conn.delete(key)
+        self.token_cache.delete(token)
 
     def get_login_phone_optional(self, request: HttpRequest) -> Optional[int]:
         """可选获取登录用户手机号, 未登录返回 None"""
@@ -181,10 +302,7 @@ class AuthSessionHelper(Generic[_T]):
     def get_login_user_optional(self, request: HttpRequest) -> Optional[_T]:
         """可选获取登录用户, 未登录返回 None"""
         phone = self.get_login_phone_optional(request)
-        user = self.user_model.objects.filter(phone=phone).first()
-        if TYPE_CHECKING:
-            user = cast(Optional[_T], user)
-        return user
+        return self._get_request_user(request, phone)
 
     def get_login_phone(self, request: HttpRequest) -> int:
         """获取登录用户手机号"""
@@ -196,11 +314,9 @@ class AuthSessionHelper(Generic[_T]):
     def get_login_user(self, request: HttpRequest) -> _T:
         """获取登录用户"""
         phone = self.get_login_phone(request)
-        user = self.user_model.objects.filter(phone=phone).first()
+        user = self._get_request_user(request, phone)
         if not user:
             raise AuthenticationError()
-        if TYPE_CHECKING:
-            user = cast(_T, user)
         return user
 
     def get_login_user_for_update(self, request: HttpRequest) -> _T:
@@ -219,12 +335,17 @@ class AuthSessionHelper(Generic[_T]):
         self.set_token(phone=phone, token=token)
         return token
 
-    def decode_token(self, token: str):
-        """解析token"""
+    def load_token(self, token: str) -> Optional[str]:
+        """从redis解析token并续期, 无效token返回 None"""
         key = self.cache_token_key + str(token)
-        value = self.redis_conn.get(key)
+        if self.renewal_cache.get(token):
+            threshold = 0
+        else:
+            threshold = self.renewal_threshold
+            self.renewal_cache.set(token, True)
+        value = self.load_token_script(keys=[key], args=[threshold, self.cache_token_expires])
         if value is None:
-            raise AuthenticationError()
+            return None
         if isinstance(value, bytes):
             value = value.decode()
 
@@ -233,12 +354,23 @@ class AuthSessionHelper(Generic[_T]):
         except Exception:
             return None
 
-    def authenticate(self, request: HttpRequest, token: str):
-        phone = self.decode_token(token)
-        if phone:
-            self.token_renewal(token=token, phone=phone)
+    def decode_token(self, token: str):
+        """解析token, 优先使用进程内缓存"""
+        phone = self.token_cache.get(token, MISSING)
+        if phone is MISSING:
+            phone = self.load_token(token)
+            self.token_cache.set(token, phone)
+        if phone is None:
+            raise AuthenticationError()
         return phone
 
+    def authenticate(self, request: HttpRequest, token: str):
+        return self.decode_token(token)
+
+    def cache_info(self):
+        """进程内token缓存命中统计"""
+        return self.token_cache.cache_info()
+
     def get_auth(self) -> AuthBearer:
         """获取认证类"""
         return self.auth
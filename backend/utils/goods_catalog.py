@@ -0,0 +1,137 @@
+import datetime
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from django.db.models import Q
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+from backend.utils import inventory
+from backend.utils.local_cache import TTLCache
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 上架商品序列化后的列表, 不含库存
+CATALOG_KEY = f"{REDIS_PREFIX}:goods:catalog"
+# 商品变动时递增, 版本不一致的缓存视为失效
+CATALOG_VERSION_KEY = f"{REDIS_PREFIX}:goods:catalog:version"
+# 没有折扣/限时结束时间时的最长缓存时间(秒)
+CATALOG_MAX_TTL = 60 * 60
+# 进程内缓存时间(秒), 其他进程修改商品后最多延迟该时间生效
+CATALOG_LOCAL_TTL = 5
+
+# 进程内缓存 (版本, 过期时间戳, 商品列表)
+local_cache: TTLCache[str, Tuple[int, float, List[Dict]]] = TTLCache(maxsize=1, ttl=CATALOG_LOCAL_TTL)
+# 商品摘要(名称, 图片), 包括已下架商品, 订单列表使用
+SUMMARY_LOCAL_TTL = 60
+summary_cache: TTLCache[int, Dict] = TTLCache(maxsize=4096, ttl=SUMMARY_LOCAL_TTL)
+
+
+def format_datetime(value: Optional[datetime.datetime]) -> Optional[str]:
+    # 与 CustomJsonEncoder 输出一致
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def build_catalog(now: datetime.datetime) -> Tuple[List[Dict], datetime.datetime]:
+    """
+    查询上架商品并序列化, 返回 (商品列表, 过期时间)
+    过期时间为最近的折扣结束/限时结束时间, 到期后价格或上架状态会变化
+    """
+    from goods.models import Goods
+
+    sale_time_filter = Q(sale_time_end__isnull=True) | Q(sale_time_end__gt=now)
+    expire_at = now + datetime.timedelta(seconds=CATALOG_MAX_TTL)
+    data = []
+    for i in Goods.objects.filter(status=True).filter(sale_time_filter):
+        is_discount = bool(i.discount_time_end and i.discount_time_end > now)
+        if is_discount:
+            expire_at = min(expire_at, i.discount_time_end)
+        if i.sale_time_end:
+            expire_at = min(expire_at, i.sale_time_end)
+
+        data.append(
+            {
+                "id": i.id,
+                "create_time": format_datetime(i.create_time),
+                "name": i.name,
+                "image": urljoin(i.image.storage.base_url, i.image.name),
+                "description": i.description,
+                "original_price": i.original_price,
+                "discount_price": i.discount_price,
+                "price": i.discount_price if is_discount else i.original_price,
+                "inventory": i.inventory,
+                "inventory_total": i.inventory_total,
+                "discount_time_end": format_datetime(i.discount_time_end) if is_discount else None,
+                "sale_time_end": format_datetime(i.sale_time_end),
+            }
+        )
+    return data, expire_at
+
+
+def get_catalog() -> List[Dict]:
+    """获取上架商品列表, 依次读取进程内缓存, redis, 数据库"""
+    now_ts = time.time()
+    cached = local_cache.get(CATALOG_KEY)
+    if cached is not None and cached[1] > now_ts:
+        return cached[2]
+
+    version, raw = redis_conn.mget(CATALOG_VERSION_KEY, CATALOG_KEY)
+    version = int(version or 0)
+    if raw:
+        payload = json.loads(raw)
+        if payload["version"] == version and payload["expire_at"] > now_ts:
+            local_cache.set(CATALOG_KEY, (version, payload["expire_at"], payload["goods"]))
+            return payload["goods"]
+
+    now = datetime.datetime.now()
+    data, expire_at = build_catalog(now)
+    expire_ts = expire_at.timestamp()
+    ttl_ms = int((expire_at - now).total_seconds() * 1000)
+    if ttl_ms > 0:
+        payload = {"version": version, "expire_at": expire_ts, "goods": data}
+        redis_conn.set(CATALOG_KEY, json.dumps(payload, ensure_ascii=False), px=ttl_ms)
+        local_cache.set(CATALOG_KEY, (version, expire_ts, data))
+    return data
+
+
+def overlay_inventory(data: List[Dict]) -> List[Dict]:
+    """用实时库存替换缓存中的库存, 优先读取 redis 中的可售库存"""
+    from goods.models import Goods
+
+    stock = inventory.get_stock_many([i["id"] for i in data])
+    missing = [goods_id for goods_id, value in stock.items() if value is None]
+    if missing:
+        stock.update(Goods.objects.filter(id__in=missing).values_list("id", "inventory"))
+    return [{**i, "inventory": i["inventory"] if stock.get(i["id"]) is None else stock[i["id"]]} for i in data]
+
+
+def get_goods_summaries(goods_ids: Iterable[int]) -> Dict[int, Dict]:
+    """按商品id批量获取摘要 {id: {"name", "image"}}, 未缓存的一次查询"""
+    from goods.models import Goods
+
+    result: Dict[int, Dict] = {}
+    missing = set()
+    for goods_id in goods_ids:
+        summary = summary_cache.get(goods_id)
+        if summary is None:
+            missing.add(goods_id)
+        else:
+            result[goods_id] = summary
+    if missing:
+        for i in Goods.objects.filter(id__in=missing).only("id", "name", "image"):
+            summary = {"name": i.name, "image": urljoin(i.image.storage.base_url, i.image.name)}
+            summary_cache.set(i.id, summary)
+            result[i.id] = summary
+    return result
+
+
+def invalidate():
+    """商品变动后调用, 其他进程的商品摘要最多 SUMMARY_LOCAL_TTL 秒后更新"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.incr(CATALOG_VERSION_KEY)
+    pipe.delete(CATALOG_KEY)
+    pipe.execute()
+    local_cache.clear()
+    summary_cache.clear()
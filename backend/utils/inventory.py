@@ -0,0 +1,135 @@
+from typing import Dict, Iterable, Optional
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+from backend.utils import job_queue
+from backend.utils.local_cache import TTLCache
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 商品可售库存, 下单时在 redis 扣减, 不锁商品行
+STOCK_KEY = f"{REDIS_PREFIX}:inventory:stock:"
+# 已在 redis 扣减但还未同步到 Goods.inventory 的数量 {goods_id: quantity}
+PENDING_KEY = f"{REDIS_PREFIX}:inventory:pending"
+# 售罄后进程内直接拒绝的时间(秒)
+SOLD_OUT_TTL = 1
+
+sold_out_cache: TTLCache[int, bool] = TTLCache(maxsize=1024, ttl=SOLD_OUT_TTL)
+
+# 扣减库存并记录待同步数量
+# KEYS[1]: 库存 KEYS[2]: 待同步
+# ARGV[1]: 商品id ARGV[2]: 数量
+# 返回剩余库存, -1 库存不足, -2 未初始化
+RESERVE_SCRIPT = """
+local stock = redis.call("GET", KEYS[1])
+if not stock then
+    return -2
+end
+local quantity = tonumber(ARGV[2])
+if tonumber(stock) < quantity then
+    return -1
+end
+redis.call("HINCRBY", KEYS[2], ARGV[1], quantity)
+return redis.call("DECRBY", KEYS[1], quantity)
+"""
+reserve_script = redis_conn.register_script(RESERVE_SCRIPT)
+
+# 归还库存, 库存未初始化时只扣减待同步数量
+RELEASE_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    redis.call("INCRBY", KEYS[1], ARGV[2])
+end
+redis.call("HINCRBY", KEYS[2], ARGV[1], -tonumber(ARGV[2]))
+return 1
+"""
+release_script = redis_conn.register_script(RELEASE_SCRIPT)
+
+
+def init_stock(goods_id: int) -> bool:
+    """从数据库初始化库存, 商品不存在返回 False"""
+    from goods.models import Goods
+
+    # 先读待同步数量再读数据库: reconcile 先更新数据库再扣减待同步数量,
+    # 两次读取之间发生同步时只会少算库存, 不会超卖
+    pending = int(redis_conn.hget(PENDING_KEY, goods_id) or 0)
+    inventory = Goods.objects.filter(id=goods_id).values_list("inventory", flat=True).first()
+    if inventory is None:
+        return False
+    redis_conn.set(STOCK_KEY + str(goods_id), max(inventory - pending, 0), nx=True)
+    return True
+
+
+def reserve(goods_id: int, quantity: int) -> bool:
+    """预扣库存, 库存不足返回 False"""
+    if sold_out_cache.get(goods_id):
+        return False
+    keys = [STOCK_KEY + str(goods_id), PENDING_KEY]
+    result = reserve_script(keys=keys, args=[goods_id, quantity])
+    if result == -2:
+        if not init_stock(goods_id):
+            return False
+        result = reserve_script(keys=keys, args=[goods_id, quantity])
+    if result == 0:
+        sold_out_cache.set(goods_id, True)
+    elif result < 0:
+        if int(redis_conn.get(keys[0]) or 0) <= 0:
+            sold_out_cache.set(goods_id, True)
+        return False
+    return True
+
+
+def release(goods_id: int, quantity: int):
+    """下单失败时归还预扣的库存"""
+    release_script(keys=[STOCK_KEY + str(goods_id), PENDING_KEY], args=[goods_id, quantity])
+    sold_out_cache.delete(goods_id)
+
+
+def schedule_reconcile():
+    """订单事务提交后异步同步到数据库"""
+    job_queue.enqueue("backend.utils.inventory.reconcile")
+
+
+def reset(goods_id: int):
+    """后台修改商品库存后调用, 下次下单时从数据库重新初始化"""
+    redis_conn.delete(STOCK_KEY + str(goods_id))
+    sold_out_cache.delete(goods_id)
+
+
+def get_stock_many(goods_ids: Iterable[int]) -> Dict[int, Optional[int]]:
+    """批量获取 redis 中的可售库存, 未初始化为 None"""
+    goods_ids = list(goods_ids)
+    if not goods_ids:
+        return {}
+    values = redis_conn.mget([STOCK_KEY + str(i) for i in goods_ids])
+    return {goods_id: None if value is None else int(value) for goods_id, value in zip(goods_ids, values)}
+
+
+def reconcile():
+    """把待同步数量扣减到 Goods.inventory"""
+    from goods.models import Goods
+
+    try:
+        with Lock(
+            redis=redis_conn,
+            name=f"{REDIS_PREFIX}:lock:inventory_reconcile",
+            timeout=30,
+            blocking=True,
+            blocking_timeout=5,
+        ):
+            for goods_id, quantity in redis_conn.hgetall(PENDING_KEY).items():
+                quantity = int(quantity)
+                if quantity <= 0:
+                    continue
+                Goods.objects.filter(id=goods_id).update(inventory=Greatest(F("inventory") - quantity, 0))
+                # 数据库提交后再扣减, 中途失败时宁可少卖不超卖
+                redis_conn.hincrby(PENDING_KEY, goods_id, -quantity)
+                logger.info(f"inventory reconcile goods={goods_id} quantity={quantity}")
+    except LockError as e:
+        # 其他进程正在同步, 本次新增的数量由其处理或下次任务处理
+        logger.warning(e)
+        job_queue.enqueue_in(5, "backend.utils.inventory.reconcile")
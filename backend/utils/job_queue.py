@@ -0,0 +1,155 @@
+import json
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+
+logger = get_logger("job_queue")
+redis_conn = get_redis_connection()
+
+# 待执行任务
+JOB_QUEUE_KEY = f"{REDIS_PREFIX}:jobs:queue"
+# 排队中的任务去重键, 相同任务排队时只保留一个
+JOB_PENDING_KEY = f"{REDIS_PREFIX}:jobs:pending"
+# 等待重试的任务, score 为重试时间
+JOB_DELAYED_KEY = f"{REDIS_PREFIX}:jobs:delayed"
+# 执行中的任务, 执行完成后移除, worker 启动时放回队列
+JOB_PROCESSING_KEY = f"{REDIS_PREFIX}:jobs:processing"
+# 重试次数用尽的任务
+JOB_FAILED_KEY = f"{REDIS_PREFIX}:jobs:failed"
+JOB_FAILED_MAX_LENGTH = 1000
+
+JOB_MAX_RETRIES = 3
+JOB_RETRY_DELAY = 5
+
+# 去重后入队
+# KEYS[1]: 去重集合 KEYS[2]: 队列 KEYS[3]: 延迟任务
+# ARGV[1]: 去重键 ARGV[2]: 任务 ARGV[3]: 执行时间, 0 为立即执行
+ENQUEUE_SCRIPT = """
+if redis.call("SADD", KEYS[1], ARGV[1]) == 1 then
+    if tonumber(ARGV[3]) > 0 then
+        redis.call("ZADD", KEYS[3], ARGV[3], ARGV[2])
+    else
+        redis.call("LPUSH", KEYS[2], ARGV[2])
+    end
+    return 1
+end
+return 0
+"""
+enqueue_script = redis_conn.register_script(ENQUEUE_SCRIPT)
+
+
+def enqueue(func: str, **kwargs) -> bool:
+    """
+    添加任务, 返回是否入队(已有相同任务排队时不重复添加)
+    func: 函数路径, 如 backend.utils.weiyi_rebate.do_rebate
+    kwargs: 函数参数, 需可以 json 序列化
+    """
+    return enqueue_in(0, func, **kwargs)
+
+
+def enqueue_in(delay: float, func: str, **kwargs) -> bool:
+    """
+    延迟 delay 秒后执行, 返回是否入队(已有相同任务等待时不重复添加)
+    JOB_QUEUE_EAGER 时忽略延迟立即执行
+    """
+    key = json.dumps({"func": func, "kwargs": kwargs}, sort_keys=True)
+    if getattr(settings, "JOB_QUEUE_EAGER", False):
+        run_job({"func": func, "kwargs": kwargs, "key": key, "attempts": 0})
+        return True
+    job = json.dumps({"func": func, "kwargs": kwargs, "key": key, "attempts": 0})
+    run_at = time.time() + delay if delay > 0 else 0
+    return bool(enqueue_script(keys=[JOB_PENDING_KEY, JOB_QUEUE_KEY, JOB_DELAYED_KEY], args=[key, job, run_at]))
+
+
+def run_job(job: Dict):
+    """执行任务, 失败时延迟重试"""
+    started = time.monotonic()
+    try:
+        import_string(job["func"])(**job["kwargs"])
+    except Exception as e:
+        logger.exception(e)
+        job["attempts"] += 1
+        job["error"] = repr(e)
+        if job["attempts"] > JOB_MAX_RETRIES:
+            pipe = redis_conn.pipeline(transaction=False)
+            pipe.lpush(JOB_FAILED_KEY, json.dumps(job))
+            pipe.ltrim(JOB_FAILED_KEY, 0, JOB_FAILED_MAX_LENGTH - 1)
+            pipe.execute()
+        else:
+            run_at = time.time() + JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            redis_conn.zadd(JOB_DELAYED_KEY, {json.dumps(job): run_at})
+        return False
+    logger.info(f"{job['func']} {job['kwargs']} done in {time.monotonic() - started:.3f}s")
+    return True
+
+
+def promote_delayed_jobs():
+    """把到期的重试任务放回队列"""
+    for job in redis_conn.zrangebyscore(JOB_DELAYED_KEY, 0, time.time()):
+        if redis_conn.zrem(JOB_DELAYED_KEY, job):
+            redis_conn.lpush(JOB_QUEUE_KEY, job)
+
+
+def requeue_processing_jobs() -> int:
+    """
+    把上次 worker 退出时未执行完的任务放回队列, 优先执行
+    只运行一个 worker, 启动时执行中列表里的任务都已中断
+    """
+    count = 0
+    while True:
+        item = redis_conn.rpoplpush(JOB_PROCESSING_KEY, JOB_QUEUE_KEY)
+        if item is None:
+            break
+        redis_conn.sadd(JOB_PENDING_KEY, json.loads(item)["key"])
+        logger.warning(f"requeue interrupted job {item}")
+        count += 1
+    return count
+
+
+def run_worker(timeout: int = 5, burst: bool = False, max_jobs: Optional[int] = None):
+    """
+    执行任务直到进程退出
+    timeout: 队列为空时的等待时间(秒)
+    burst: 队列为空且没有即将重试的任务时退出
+    max_jobs: 执行指定数量任务后退出
+    """
+    requeue_processing_jobs()
+    count = 0
+    while max_jobs is None or count < max_jobs:
+        promote_delayed_jobs()
+        # 取出时原子地移到执行中列表, worker 中途退出时任务不丢失
+        item = redis_conn.brpoplpush(JOB_QUEUE_KEY, JOB_PROCESSING_KEY, timeout=timeout)
+        if item is None:
+            # 只等待重试中的任务, 不等待很久以后的延迟任务
+            retry_window = JOB_RETRY_DELAY * 2**JOB_MAX_RETRIES
+            if burst and not redis_conn.zcount(JOB_DELAYED_KEY, 0, time.time() + retry_window):
+                break
+            continue
+        job = json.loads(item)
+        # 开始执行前移除去重键, 执行期间的新触发会再排队一次
+        redis_conn.srem(JOB_PENDING_KEY, job["key"])
+        run_job(job)
+        redis_conn.lrem(JOB_PROCESSING_KEY, 1, item)
+        count += 1
+
+
+def stats() -> Dict[str, int]:
+    """队列状态"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.llen(JOB_QUEUE_KEY)
+    pipe.scard(JOB_PENDING_KEY)
+    pipe.zcard(JOB_DELAYED_KEY)
+    pipe.llen(JOB_PROCESSING_KEY)
+    pipe.llen(JOB_FAILED_KEY)
+    queued, pending, delayed, processing, failed = pipe.execute()
+    return {
+        "queued": queued,
+        "pending": pending,
+        "delayed": delayed,
+        "processing": processing,
+        "failed": failed,
+    }
@@ -0,0 +1,107 @@
+from typing import Iterable, List, Optional, Tuple
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 每个等级一个 ZSET, member 为用户id, score 为积分
+LEADERBOARD_KEY = f"{REDIS_PREFIX}:leaderboard:"
+LEADERBOARD_READY_KEY = f"{REDIS_PREFIX}:leaderboard:ready"
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def leaderboard_levels() -> List[str]:
+    """排行榜等级, 与 User.LevelChoice 一致"""
+    # user.models 导入本模块, 在函数内导入避免循环导入
+    from user.models import User
+
+    return list(User.LevelChoice.values)
+
+
+def leaderboard_key(level: str) -> str:
+    return LEADERBOARD_KEY + str(level)
+
+
+def is_ready() -> bool:
+    """排行榜是否已构建, 未构建时调用方应回退到数据库查询"""
+    return bool(redis_conn.exists(LEADERBOARD_READY_KEY))
+
+
+def update_scores(users: Iterable[Tuple[int, str, int]]):
+    """更新用户积分和等级 users: [(user_id, level, credits)]"""
+    pipe = redis_conn.pipeline(transaction=False)
+    count = 0
+    levels = leaderboard_levels()
+    for user_id, level, credits in users:
+        for i in levels:
+            if i != level:
+                pipe.zrem(leaderboard_key(i), user_id)
+        pipe.zadd(leaderboard_key(level), {str(user_id): credits})
+        count += 1
+    if count:
+        pipe.execute()
+
+
+def update_score(user_id: int, level: str, credits: int):
+    """更新单个用户积分和等级"""
+    update_scores([(user_id, level, credits)])
+
+
+def sync_users(user_ids: Iterable[int]):
+    """从数据库同步指定用户(积分或等级变动提交后调用)"""
+    from user.models import User
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    update_scores(User.objects.filter(id__in=user_ids).values_list("id", "level", "credits"))
+
+
+def get_rank(level: str, credits: int) -> Optional[int]:
+    """同等级中积分不低于 credits 的人数, 未构建返回 None"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.exists(LEADERBOARD_READY_KEY)
+    pipe.zcount(leaderboard_key(level), credits, "+inf")
+    ready, rank = pipe.execute()
+    if not ready:
+        return None
+    return int(rank)
+
+
+def get_top(level: str, num: int) -> List[Tuple[int, int]]:
+    """积分前 num 名 [(user_id, credits)]"""
+    result = redis_conn.zrevrange(leaderboard_key(level), 0, num - 1, withscores=True)
+    return [(int(user_id), int(score)) for user_id, score in result]
+
+
+def rebuild():
+    """从数据库重建排行榜"""
+    from user.models import User
+
+    for level in leaderboard_levels():
+        key = leaderboard_key(level)
+        tmp_key = f"{key}:rebuild"
+        redis_conn.delete(tmp_key)
+        queryset = User.objects.filter(level=level).values_list("id", "credits").order_by()
+        total = 0
+        mapping = {}
+        for user_id, credits in queryset.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            mapping[str(user_id)] = credits
+            if len(mapping) >= REBUILD_BATCH_SIZE:
+                redis_conn.zadd(tmp_key, mapping)
+                total += len(mapping)
+                mapping = {}
+        if mapping:
+            redis_conn.zadd(tmp_key, mapping)
+            total += len(mapping)
+
+        # 原子替换, 重建期间读取不受影响
+        if total:
+            redis_conn.rename(tmp_key, key)
+        else:
+            redis_conn.delete(key)
+        logger.info(f"leaderboard {level} rebuilt: {total}")
+
+    redis_conn.set(LEADERBOARD_READY_KEY, 1)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+_KT = TypeVar("_KT", bound=Hashable)
+_VT = TypeVar("_VT")
+
+# 区分 "未命中" 和 "缓存了 None"(负缓存)
+MISSING: Any = object()
+
+
+class TTLCache(Generic[_KT, _VT]):
+    """进程内 LRU + TTL 缓存, 每个 uwsgi worker 各自持有一份"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        """
+        maxsize: 最大缓存条数, 超出后淘汰最久未使用的条目
+        ttl: 默认过期时间(秒), <= 0 时不缓存
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[_KT, Tuple[float, _VT]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: _KT, default: Any = None) -> Any:
+        """获取缓存, 未命中或已过期返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire_at, value = item
+                if expire_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: _KT, value: _VT, ttl: Optional[float] = None):
+        """设置缓存, ttl 为空时使用默认过期时间"""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: _KT):
+        """删除缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def cache_info(self) -> Dict[str, int]:
+        """命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
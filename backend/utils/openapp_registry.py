@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from django.utils.crypto import constant_time_compare
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+
+if TYPE_CHECKING:
+    from openapi.models import OpenApp
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# OpenApp 变动时递增, 各进程发现版本变化后重新加载
+REGISTRY_VERSION_KEY = f"{REDIS_PREFIX}:openapp:version"
+# 检查版本的间隔(秒), 其他进程修改后最多延迟该时间生效
+REGISTRY_CHECK_INTERVAL = 1
+
+
+class OpenAppRegistry:
+    """进程内缓存全部 OpenApp, 按 app_id 和 id 查询"""
+
+    def __init__(self):
+        self.by_app_id: Dict[str, "OpenApp"] = {}
+        self.by_id: Dict[int, "OpenApp"] = {}
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, version: int):
+        from openapi.models import OpenApp
+
+        apps = list(OpenApp.objects.all())
+        self.by_app_id = {i.app_id: i for i in apps}
+        self.by_id = {i.id: i for i in apps}
+        self.version = version
+        logger.info(f"openapp registry loaded: {len(apps)} version={version}")
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < REGISTRY_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self.version is not None and now - self.checked_at < REGISTRY_CHECK_INTERVAL:
+                return
+            version = int(redis_conn.get(REGISTRY_VERSION_KEY) or 0)
+            if version != self.version:
+                self.load(version)
+            self.checked_at = now
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+
+
+registry = OpenAppRegistry()
+
+
+def get_by_app_id(app_id: str) -> "OpenApp":
+    """按 app_id 获取, 不存在时抛出 OpenApp.DoesNotExist"""
+    from openapi.models import OpenApp
+
+    registry.ensure_loaded()
+    app = registry.by_app_id.get(app_id)
+    if app is None:
+        raise OpenApp.DoesNotExist(f"OpenApp app_id={app_id!r} does not exist")
+    return app
+
+
+def get_by_id(_id: int) -> "OpenApp":
+    """按 id 获取, 不存在时抛出 OpenApp.DoesNotExist"""
+    from openapi.models import OpenApp
+
+    registry.ensure_loaded()
+    app = registry.by_id.get(_id)
+    if app is None:
+        raise OpenApp.DoesNotExist(f"OpenApp id={_id!r} does not exist")
+    return app
+
+
+def authenticate(app_id: str, app_secret: str) -> Optional["OpenApp"]:
+    """校验应用密钥, 失败返回 None"""
+    registry.ensure_loaded()
+    app = registry.by_app_id.get(app_id)
+    if app is None or not constant_time_compare(app.app_secret, app_secret):
+        return None
+    return app
+
+
+def invalidate():
+    """OpenApp 变动后调用"""
+    redis_conn.incr(REGISTRY_VERSION_KEY)
+    registry.clear()
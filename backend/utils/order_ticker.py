@@ -0,0 +1,84 @@
+import json
+from typing import Dict, List
+
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 最新订单列表, 每项为 json {"id", "name", "phone"}
+TICKER_KEY = f"{REDIS_PREFIX}:order:ticker"
+# 列表已从数据库构建
+TICKER_READY_KEY = f"{REDIS_PREFIX}:order:ticker:ready"
+TICKER_SIZE = 10
+
+# 列表已构建时才写入, 未构建时由 rebuild 从数据库读取
+# KEYS[1]: 就绪标记 KEYS[2]: 列表
+# ARGV[1]: 订单 ARGV[2]: 保留条数
+PUSH_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    redis.call("LPUSH", KEYS[2], ARGV[1])
+    redis.call("LTRIM", KEYS[2], 0, tonumber(ARGV[2]) - 1)
+    return 1
+end
+return 0
+"""
+push_script = redis_conn.register_script(PUSH_SCRIPT)
+
+
+def push(order_id: int, goods_name: str, phone_mask: str):
+    """下单事务提交后调用"""
+    item = json.dumps({"id": order_id, "name": goods_name, "phone": phone_mask}, ensure_ascii=False)
+    push_script(keys=[TICKER_READY_KEY, TICKER_KEY], args=[item, TICKER_SIZE])
+
+
+def _query_latest() -> List[Dict]:
+    from order.models import Order
+
+    queryset = Order.objects.order_by("-id").select_related("goods", "user").only("goods__name", "user__phone")[:TICKER_SIZE]
+    return [{"id": i.id, "name": i.goods.name, "phone": i.user.phone_mask} for i in queryset]
+
+
+def rebuild() -> List[Dict]:
+    """从数据库重建"""
+    data = _query_latest()
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.delete(TICKER_KEY)
+    if data:
+        pipe.rpush(TICKER_KEY, *[json.dumps(i, ensure_ascii=False) for i in data])
+    pipe.set(TICKER_READY_KEY, 1)
+    pipe.execute()
+    return data
+
+
+def invalidate():
+    """订单删除后调用, 下次读取时重建"""
+    redis_conn.delete(TICKER_READY_KEY)
+
+
+def get_latest() -> List[Dict]:
+    """最新订单, 未构建时从数据库重建"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.exists(TICKER_READY_KEY)
+    pipe.lrange(TICKER_KEY, 0, TICKER_SIZE - 1)
+    ready, items = pipe.execute()
+    if ready:
+        return [json.loads(i) for i in items]
+
+    try:
+        with Lock(
+            redis=redis_conn,
+            name=f"{REDIS_PREFIX}:lock:order_ticker_rebuild",
+            timeout=10,
+            blocking=True,
+            blocking_timeout=3,
+        ):
+            if redis_conn.exists(TICKER_READY_KEY):
+                return [json.loads(i) for i in redis_conn.lrange(TICKER_KEY, 0, TICKER_SIZE - 1)]
+            return rebuild()
+    except LockError as e:
+        logger.warning(e)
+        return _query_latest()
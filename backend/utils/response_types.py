@@ -1,13 +1,38 @@
 from __future__ import annotations
 
 from pydantic import BaseModel
-from typing import Dict, Iterable, List, Union
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
 from typing_extensions import TypedDict
 from django.core.paginator import Page, Paginator
+from django.db.models import QuerySet
 
 DataType = Union[Dict, TypedDict, BaseModel]
 
 
+class CursorPage(NamedTuple):
+    object_list: List
+    next_id: Optional[int]  # 下一页的 last_id, 没有下一页时为 None
+    total: Optional[int]  # 不统计总数时为 None
+
+
+def cursor_page(queryset: QuerySet, size: int, last_id: int = 0, with_total: bool = False) -> CursorPage:
+    """
+    按 id 倒序游标分页, 用 id < last_id 代替 OFFSET, 翻页越深也不需要扫描跳过的行
+    last_id: 上一页最后一条的 id, 0 为第一页
+    with_total: 是否统计总数(COUNT)
+    """
+    total = queryset.count() if with_total else None
+    if last_id > 0:
+        queryset = queryset.filter(id__lt=last_id)
+    # 多取一条判断是否还有下一页
+    object_list = list(queryset.order_by("-id")[: size + 1])
+    next_id = None
+    if len(object_list) > size:
+        object_list = object_list[:size]
+        next_id = object_list[-1].id
+    return CursorPage(object_list=object_list, next_id=next_id, total=total)
+
+
 class Response:
     @classmethod
     def ok(cls):
@@ -40,3 +65,10 @@ class Response:
         total = page.count
         total_page = page.num_pages
         return cls.page_list(data=data, total=total, total_page=total_page)
+
+    @classmethod
+    def cursor_list(cls, data: List | Iterable, page: CursorPage):
+        result = {"code": 200, "msg": "OK", "data": data, "next_id": page.next_id}
+        if page.total is not None:
+            result["total"] = page.total
+        return result
@@ -1,7 +1,8 @@
-from django.db.models import Sum
+from django.db.models import Q
 import typing
-from user.models import User, UserWeiyiTreasure, WeiyiTreasureInfo, UserCreditsLog
+from user.models import LEVEL_C_TO_B_TOTAL_INCOME, User, UserWeiyiTreasure, WeiyiTreasureInfo
 from backend.settings import get_logger, get_redis_connection, REDIS_PREFIX
+from backend.utils import leaderboard
 
 logger = get_logger()
 redis_conn = get_redis_connection()
@@ -12,9 +13,10 @@ from redis.lock import Lock
 def treasure_to_a():
     users = list(
         UserWeiyiTreasure.objects.filter(
+            user__isnull=False,
             commodity_uuid__in=WeiyiTreasureInfo.objects.filter(
                 is_gold=True,
-            ).values_list("commodity_uuid")
+            ).values_list("commodity_uuid"),
         )
         .values_list("user", flat=True)
         .exclude(user__level=User.LevelChoice.A)
@@ -24,6 +26,7 @@ def treasure_to_a():
     if users:
         logger.info(users)
         User.objects.filter(id__in=users).update(level=User.LevelChoice.A)
+        leaderboard.sync_users(users)
 
 
 def invie_c_to_b():
@@ -36,19 +39,20 @@ def invie_c_to_b():
     if users:
         logger.info(users)
         User.objects.filter(id__in=users).update(level=User.LevelChoice.B)
+        leaderboard.sync_users(users)
 
 
 def credits_c_to_b():
     users = list(
-        UserCreditsLog.objects.filter(user__in=User.objects.filter(level=User.LevelChoice.C), operation=1)
-        .values("user")
-        .annotate(credits_sum=Sum("value"))
-        .filter(credits_sum__gte=100000)
-        .values_list("user", flat=True)
+        User.objects.filter(
+            level=User.LevelChoice.C,
+            total_income__gte=LEVEL_C_TO_B_TOTAL_INCOME,
+        ).values_list("id", flat=True)
     )
     if users:
         logger.info(users)
         User.objects.filter(id__in=users).update(level=User.LevelChoice.B)
+        leaderboard.sync_users(users)
 
 
 def do_update_user_level():
@@ -64,4 +68,40 @@ def do_update_user_level():
             invie_c_to_b()
             credits_c_to_b()
     except Exception as e:
+        # 抛出给任务队列重试
         logger.warning(e)
+        raise
+
+
+def update_users_level(user_ids: typing.Iterable[int]):
+    """增量更新指定用户及其直接下级的等级, 规则同 do_update_user_level"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+
+    to_a = list(
+        UserWeiyiTreasure.objects.filter(
+            user__in=user_ids,
+            commodity_uuid__in=WeiyiTreasureInfo.objects.filter(
+                is_gold=True,
+            ).values_list("commodity_uuid"),
+        )
+        .exclude(user__level=User.LevelChoice.A)
+        .values_list("user", flat=True)
+        .distinct()
+    )
+    if to_a:
+        logger.info(to_a)
+        User.objects.filter(id__in=to_a).update(level=User.LevelChoice.A)
+
+    # 邀请人升级为 A 后, 直接下级也可能升级
+    to_b = list(
+        User.objects.filter(Q(id__in=user_ids) | Q(parent__in=user_ids), level=User.LevelChoice.C)
+        .filter(Q(parent__level=User.LevelChoice.A) | Q(total_income__gte=LEVEL_C_TO_B_TOTAL_INCOME))
+        .values_list("id", flat=True)
+    )
+    if to_b:
+        logger.info(to_b)
+        User.objects.filter(id__in=to_b).update(level=User.LevelChoice.B)
+
+    leaderboard.sync_users(to_a + to_b)
@@ -7,10 +7,13 @@ from .config import (
     WEIYI_REDIRECT_URI,
     WEIYI_SCOPES,
 )
+from .aio import AsyncWeiyiClient
 from .main import WeiyiClient
 
 __all__ = [
+    "AsyncWeiyiClient",
     "WeiyiClient",
+    "async_weiyi_client",
     "weiyi_client",
 ]
 
@@ -23,3 +26,13 @@ weiyi_client = WeiyiClient(
     base_url=WEIYI_BASE_URL,
     api_base_url=WEIYI_API_BASE_URL,
 )
+
+async_weiyi_client = AsyncWeiyiClient(
+    app_id=WEIYI_APP_ID,
+    app_key=WEIYI_APP_KEY,
+    cipher=WEIYI_CIPHER,
+    scopes=WEIYI_SCOPES,
+    redirect_uri=WEIYI_REDIRECT_URI,
+    base_url=WEIYI_BASE_URL,
+    api_base_url=WEIYI_API_BASE_URL,
+)
@@ -0,0 +1,153 @@
+"""
+异步版本, ASGI 部署时在 async 视图中使用, 等待上游期间不占用 worker
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+import httpx
+
+from .http_client import BaseResilientSession
+from .main import ENDPOINT_TIMEOUTS, BaseWeiyiClient, WeiyiRequest
+from .models import AccessTokenData, UserCollectionListData, UserInfo
+from .treasure_api import (
+    FETCH_CONCURRENCY,
+    FETCH_TIMEOUT,
+    TreasureData,
+    build_treasure_request,
+    get_total_page,
+    parse_treasure_response,
+    url,
+)
+
+
+class AsyncResilientSession(BaseResilientSession):
+    """
+    基于 httpx 连接池, scope() 范围内的请求共用一个连接池, 退出时关闭连接
+    连接绑定事件循环, WSGI 下每次调用 async 视图会新建并关闭事件循环, 不能跨请求保留连接池
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client: ContextVar[httpx.AsyncClient | None] = ContextVar(f"weiyi_http_{id(self)}", default=None)
+
+    @asynccontextmanager
+    async def scope(self) -> AsyncIterator[httpx.AsyncClient]:
+        """范围内共用连接池, 嵌套时使用外层的连接池"""
+        client = self._client.get()
+        if client is not None:
+            yield client
+            return
+        async with httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize),
+        ) as client:
+            token = self._client.set(client)
+            try:
+                yield client
+            finally:
+                self._client.reset(token)
+
+    async def post(self, endpoint: str, url: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+        """
+        endpoint: 接口名, 用于超时配置和耗时统计
+        idempotent: 是否可以重试
+        """
+        self._check_breaker()
+        connect_timeout, read_timeout = self.timeouts.get(endpoint, self.default_timeout)
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        attempts = self._attempts(idempotent)
+        async with self.scope() as client:
+            for attempt in range(attempts):
+                if attempt:
+                    await asyncio.sleep(self._retry_delay(attempt))
+                started = time.monotonic()
+                try:
+                    response = await client.post(url, timeout=timeout, **kwargs)
+                except httpx.HTTPError as e:
+                    self._on_error(endpoint, attempt, attempts, time.monotonic() - started, e)
+                    continue
+                except BaseException:
+                    # 被取消等非上游错误不计为失败, 但要释放试探名额, 否则熔断无法恢复
+                    self.breaker.release_trial()
+                    raise
+                if self._on_response(endpoint, attempt, attempts, time.monotonic() - started, response.status_code):
+                    return response
+        raise AssertionError("unreachable")
+
+
+class AsyncWeiyiClient(BaseWeiyiClient):
+    def __init__(self, *args, http: AsyncResilientSession | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http = http or AsyncResilientSession(timeouts=ENDPOINT_TIMEOUTS)
+
+    async def _send(self, request: WeiyiRequest):
+        response = await self.http.post(request.endpoint, request.url, idempotent=request.idempotent, **request.kwargs)
+        return self._try_response_get_data(response.status_code, response.text, request.model)
+
+    async def get_access_token(self, code: str) -> AccessTokenData:
+        """换取访问凭证"""
+        return await self._send(self._access_token_request(code))
+
+    async def refresh_token(self, refresh_token: str) -> AccessTokenData:
+        """刷新访问凭证"""
+        return await self._send(self._refresh_token_request(refresh_token))
+
+    async def get_user_base_info(self, access_token: str) -> UserInfo:
+        """获取用户信息"""
+        return (await self._send(self._user_base_info_request(access_token))).userInfo
+
+    async def get_user_position_list(self, page: int, page_size: int, access_token: str) -> UserCollectionListData:
+        """获取用户藏品列表"""
+        return await self._send(self._user_position_list_request(page, page_size, access_token))
+
+
+treasure_http = AsyncResilientSession(pool_maxsize=FETCH_CONCURRENCY, default_timeout=FETCH_TIMEOUT)
+
+
+async def fetch_treasure_page(phone: str, page: int, commodity_name: str | None = None) -> TreasureData:
+    """获取一页藏品"""
+    response = await treasure_http.post(
+        "verifyUser", url, idempotent=True, json=build_treasure_request(phone, page, commodity_name)
+    )
+    return parse_treasure_response(response.status_code, response.text)
+
+
+async def iter_user_treasure_pages(
+    phone: str,
+    commodity_name: str | None = None,
+    concurrency: int = FETCH_CONCURRENCY,
+) -> AsyncIterator[TreasureData]:
+    """
+    按页码顺序逐页返回藏品, 空页不返回
+    第一页返回总数后, 其余页并发请求
+    """
+    first = await fetch_treasure_page(phone, 1, commodity_name)
+    if not first.treasureDetails:
+        return
+    yield first
+
+    pages = range(2, get_total_page(first) + 1)
+    if not pages:
+        return
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(page: int) -> TreasureData:
+        async with semaphore:
+            return await fetch_treasure_page(phone, page, commodity_name)
+
+    tasks = [asyncio.ensure_future(fetch(page)) for page in pages]
+    try:
+        for task in tasks:
+            data = await task
+            if not data.treasureDetails:
+                break
+            yield data
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
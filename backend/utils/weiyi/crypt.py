@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Callable, Union
+from typing import Callable, Optional, Union
 
 from Cryptodome import Random
 from Cryptodome.Cipher.PKCS1_v1_5 import PKCS115_Cipher
@@ -7,6 +8,11 @@ from Cryptodome.PublicKey import RSA
 
 Buffer = Union[bytes, bytearray, memoryview]
 
+# 单个响应密文最大长度, 超过视为异常响应
+MAX_CIPHERTEXT_SIZE = 4 * 1024 * 1024
+# 分块数达到该值时使用线程池解密
+PARALLEL_MIN_BLOCKS = 64
+
 
 def batched(source: Buffer, size: int):
     for i in range(0, len(source), size):
@@ -18,7 +24,13 @@ class RsaCipher(PKCS115_Cipher):
         self,
         key: RSA.RsaKey,
         randfunc: Callable[[int], bytes],
+        max_ciphertext_size: int = MAX_CIPHERTEXT_SIZE,
+        max_workers: int = 0,
     ):
+        """
+        max_ciphertext_size: 解密前检查密文长度
+        max_workers: 大密文使用线程池分块解密, 0 为不使用
+        """
         self._key = key
         self._randfunc = randfunc
 
@@ -28,6 +40,10 @@ class RsaCipher(PKCS115_Cipher):
         # mLen <= k - 11
         self._key_length = key.size_in_bytes()
         self._message_length = self._key_length - 11
+        self._max_ciphertext_size = max_ciphertext_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rsa_decrypt")
 
         super().__init__(self._key, self._randfunc)
 
@@ -37,11 +53,29 @@ class RsaCipher(PKCS115_Cipher):
             buffer.write(super().encrypt(chunk))
         return buffer.getvalue()
 
+    def _decrypt_block(self, block: memoryview) -> bytes:
+        return super().decrypt(block, b"")
+
     def decrypt(self, ciphertext: Buffer) -> bytes:
-        buffer = BytesIO()
-        for chunk in batched(ciphertext, self._key_length):
-            buffer.write(super().decrypt(chunk, b""))
-        return buffer.getvalue()
+        if len(ciphertext) > self._max_ciphertext_size:
+            raise ValueError(f"密文过长: {len(ciphertext)}")
+
+        # 按块切片不复制, 明文写入预分配的缓冲区
+        view = memoryview(ciphertext)
+        blocks = list(batched(view, self._key_length))
+        if self._executor is not None and len(blocks) >= PARALLEL_MIN_BLOCKS:
+            chunks = self._executor.map(self._decrypt_block, blocks)
+        else:
+            chunks = map(self._decrypt_block, blocks)
+
+        output = bytearray(len(blocks) * self._message_length)
+        offset = 0
+        for chunk in chunks:
+            size = len(chunk)
+            output[offset : offset + size] = chunk
+            offset += size
+        del output[offset:]
+        return bytes(output)
 
     @classmethod
     def new(cls, key: RSA.RsaKey):
@@ -0,0 +1,201 @@
+import bisect
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+Timeout = Tuple[float, float]  # (连接超时, 读取超时)
+
+
+class CircuitOpenError(ValueError):
+    """熔断中, 直接失败不请求上游"""
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断, reset_timeout 秒后放行一个试探请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release_trial(self):
+        """试探请求未得到结果(如被取消)时调用, 允许下一个试探请求"""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"circuit breaker open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """请求耗时分布(秒)"""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "errors": self.errors,
+            "buckets": {str(le): n for le, n in zip(self.BUCKETS, self.counts)},
+        }
+
+
+class BaseResilientSession:
+    """
+    上游请求: 按接口设置超时, 幂等请求有限次抖动重试, 熔断, 耗时统计
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        timeouts: Optional[Dict[str, Timeout]] = None,
+        default_timeout: Timeout = (3, 10),
+        max_retries: int = 2,
+        retry_backoff: float = 0.2,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        pool_maxsize: 每个 host 保持的连接数
+        timeouts: {接口名: (连接超时, 读取超时)}
+        default_timeout: 未配置接口的超时
+        max_retries: 幂等请求失败后的最大重试次数
+        retry_backoff: 重试等待基数(秒), 按次数指数增长并加随机抖动
+        breaker: 熔断器
+        """
+        self.pool_maxsize = pool_maxsize
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def _observe(self, endpoint: str, seconds: float, error: bool):
+        histogram = self.histograms.get(endpoint)
+        if histogram is None:
+            histogram = self.histograms.setdefault(endpoint, LatencyHistogram())
+        histogram.observe(seconds, error)
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("服务暂不可用, 请稍后再试")
+
+    def _attempts(self, idempotent: bool) -> int:
+        return 1 + (self.max_retries if idempotent else 0)
+
+    def _retry_delay(self, attempt: int) -> float:
+        return self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    def _on_error(self, endpoint: str, attempt: int, attempts: int, seconds: float, e: Exception):
+        """网络错误, 最后一次尝试时抛出"""
+        self._observe(endpoint, seconds, error=True)
+        self.breaker.record_failure()
+        logger.warning(f"{endpoint} attempt={attempt + 1} {e!r}")
+        if attempt + 1 >= attempts:
+            raise ValueError(f"请求失败: {e.__class__.__name__}") from e
+
+    def _on_response(self, endpoint: str, attempt: int, attempts: int, seconds: float, status_code: int) -> bool:
+        """返回是否结束重试"""
+        server_error = status_code >= 500
+        self._observe(endpoint, seconds, error=server_error)
+        if not server_error:
+            self.breaker.record_success()
+            return True
+        self.breaker.record_failure()
+        logger.warning(f"{endpoint} attempt={attempt + 1} status={status_code}")
+        return attempt + 1 >= attempts
+
+    def stats(self) -> Dict:
+        """各接口耗时分布和熔断状态"""
+        return {
+            "breaker": self.breaker.state,
+            "endpoints": {endpoint: histogram.snapshot() for endpoint, histogram in self.histograms.items()},
+        }
+
+
+class ResilientSession(BaseResilientSession):
+    """基于 requests 连接池"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, endpoint: str, url: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        """
+        endpoint: 接口名, 用于超时配置和耗时统计
+        idempotent: 是否可以重试
+        """
+        self._check_breaker()
+        timeout = self.timeouts.get(endpoint, self.default_timeout)
+        attempts = self._attempts(idempotent)
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(self._retry_delay(attempt))
+            started = time.monotonic()
+            try:
+                response = self.session.post(url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                self._on_error(endpoint, attempt, attempts, time.monotonic() - started, e)
+                continue
+            except BaseException:
+                # 非上游错误不计为失败, 但要释放试探名额, 否则熔断无法恢复
+                self.breaker.release_trial()
+                raise
+            if self._on_response(endpoint, attempt, attempts, time.monotonic() - started, response.status_code):
+                return response
+        raise AssertionError("unreachable")
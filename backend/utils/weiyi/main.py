@@ -1,17 +1,17 @@
 import base64
 import json
-from typing import TypeVar
+from typing import Any, Dict, NamedTuple, TypeVar
 from urllib.parse import urlencode, urljoin
 
-import requests
 from loguru import logger
 from pydantic import BaseModel, ValidationError
 
 from .crypt import RsaCipher
+from .http_client import ResilientSession
+from .parsing import loads
 from .models import (
     AccessTokenData,
     ErrorResponse,
-    RawResponse,
     UserCollectionListData,
     UserInfo,
     UserInfoData,
@@ -23,7 +23,26 @@ from .models import (
 DataT = TypeVar("DataT", bound=BaseModel)
 
 
-class WeiyiClient:
+class WeiyiRequest(NamedTuple):
+    """同步和异步客户端共用的请求参数"""
+
+    endpoint: str  # 接口名, 用于超时配置和耗时统计
+    url: str
+    model: type[BaseModel]  # 响应 data 的模型
+    idempotent: bool = False  # 是否可以重试
+    kwargs: Dict[str, Any] = {}
+
+
+# 各接口 (连接超时, 读取超时)
+ENDPOINT_TIMEOUTS = {
+    "accesstoken": (3, 10),
+    "refreshtoken": (3, 10),
+    "user_base_info": (3, 5),
+    "user_position_list": (3, 10),
+}
+
+
+class BaseWeiyiClient:
     def __init__(
         self,
         app_id: str,
@@ -42,27 +61,33 @@ class WeiyiClient:
         self.base_url = base_url
         self.api_base_url = api_base_url
 
-    def __try_response_get_data(self, response: requests.Response, model: type[DataT]) -> DataT:
-        if not response.ok:
-            logger.warning(response.text)
-            raise ValueError(f"请求失败: {response.status_code}")
+    def _try_response_get_data(self, status_code: int, text: str | bytes, model: type[DataT]) -> DataT:
+        """只解析一次 json, 直接校验 data"""
+        if status_code >= 400:
+            logger.warning(text)
+            raise ValueError(f"请求失败: {status_code}")
         try:
-            raw_response = RawResponse.parse_raw(response.text)
-            if isinstance(raw_response.data, dict):
-                return model.parse_obj(raw_response.data)
-            if isinstance(raw_response.data, str):
-                datadata_bytes = base64.b64decode(raw_response.data)
+            payload = loads(text)
+        except ValueError:
+            logger.warning(text)
+            raise ValueError("解析错误")
+        try:
+            if not isinstance(payload, dict):
+                raise ValueError("解析错误")
+            if payload.get("code") != 200:
+                raise ValueError(ErrorResponse.parse_obj(payload).message)
+            data = payload.get("data")
+            if isinstance(data, dict):
+                return model.parse_obj(data)
+            if isinstance(data, str):
+                datadata_bytes = base64.b64decode(data)
                 data_decrypted = self.cipher.decrypt(datadata_bytes)
-                return model.parse_raw(data_decrypted)
+                return model.parse_obj(loads(data_decrypted))
             raise ValueError("data错误")
-        except ValidationError as e:
+        except (ValidationError, json.JSONDecodeError) as e:
             logger.exception(e)
-            logger.warning(response.text)
-            try:
-                error_response = ErrorResponse.parse_raw(response.text)
-            except ValidationError:
-                raise ValueError("解析错误")
-            raise ValueError(error_response.message)
+            logger.warning(text)
+            raise ValueError("解析错误")
 
     def get_authorization_url(self, debug: bool) -> str:
         """获取授权登录页"""
@@ -76,50 +101,87 @@ class WeiyiClient:
         authorization_url = urljoin(self.base_url, "Authorize")
         return f"{authorization_url}?{params}" + ("&debug=true" if debug else "")
 
-    def get_access_token(self, code: str) -> AccessTokenData:
-        """换取访问凭证"""
-        response = requests.post(
+    def _access_token_request(self, code: str) -> WeiyiRequest:
+        # code 只能使用一次, 不重试
+        return WeiyiRequest(
+            "accesstoken",
             urljoin(self.api_base_url, "/oauth/api/oauth2/accesstoken"),
-            json={
-                "appId": self.app_id,
-                "secret": self.app_key,
-                "code": code,
+            AccessTokenData,
+            kwargs={
+                "json": {
+                    "appId": self.app_id,
+                    "secret": self.app_key,
+                    "code": code,
+                },
             },
         )
 
-        return self.__try_response_get_data(response, AccessTokenData)
-
-    def refresh_token(self, refresh_token: str) -> AccessTokenData:
-        """刷新访问凭证"""
-        response = requests.post(
+    def _refresh_token_request(self, refresh_token: str) -> WeiyiRequest:
+        # refresh token 刷新后失效, 不重试
+        return WeiyiRequest(
+            "refreshtoken",
             urljoin(self.api_base_url, "/oauth/api/oauth2/refreshtoken"),
-            json={
-                "appId": self.app_id,
-                "refreshToken": refresh_token,
+            AccessTokenData,
+            kwargs={
+                "json": {
+                    "appId": self.app_id,
+                    "refreshToken": refresh_token,
+                },
             },
         )
-        return self.__try_response_get_data(response, AccessTokenData)
 
-    def get_user_base_info(self, access_token: str) -> UserInfo:
-        """获取用户信息"""
-        response = requests.post(
+    def _user_base_info_request(self, access_token: str) -> WeiyiRequest:
+        return WeiyiRequest(
+            "user_base_info",
             urljoin(self.api_base_url, "/oauth/api/gtw/user_base_info"),
-            params={
-                "accessToken": access_token,
+            UserInfoData,
+            idempotent=True,
+            kwargs={
+                "params": {
+                    "accessToken": access_token,
+                },
             },
         )
-        return self.__try_response_get_data(response, UserInfoData).userInfo
 
-    def get_user_position_list(self, page: int, page_size: int, access_token: str) -> UserCollectionListData:
-        """获取用户藏品列表"""
-        response = requests.post(
+    def _user_position_list_request(self, page: int, page_size: int, access_token: str) -> WeiyiRequest:
+        return WeiyiRequest(
+            "user_position_list",
             urljoin(self.api_base_url, "/oauth/api/gtw/user_position_list"),
-            params={
-                "accessToken": access_token,
-            },
-            json={
-                "page": page,
-                "pageSize": page_size,
+            UserCollectionListData,
+            idempotent=True,
+            kwargs={
+                "params": {
+                    "accessToken": access_token,
+                },
+                "json": {
+                    "page": page,
+                    "pageSize": page_size,
+                },
             },
         )
-        return self.__try_response_get_data(response, UserCollectionListData)
+
+
+class WeiyiClient(BaseWeiyiClient):
+    def __init__(self, *args, http: ResilientSession | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http = http or ResilientSession(timeouts=ENDPOINT_TIMEOUTS)
+
+    def _send(self, request: WeiyiRequest):
+        response = self.http.post(request.endpoint, request.url, idempotent=request.idempotent, **request.kwargs)
+        return self._try_response_get_data(response.status_code, response.text, request.model)
+
+    def get_access_token(self, code: str) -> AccessTokenData:
+        """换取访问凭证"""
+        return self._send(self._access_token_request(code))
+
+    def refresh_token(self, refresh_token: str) -> AccessTokenData:
+        """刷新访问凭证"""
+        return self._send(self._refresh_token_request(refresh_token))
+
+    def get_user_base_info(self, access_token: str) -> UserInfo:
+        """获取用户信息"""
+        return self._send(self._user_base_info_request(access_token)).userInfo
+
+    def get_user_position_list(self, page: int, page_size: int, access_token: str) -> UserCollectionListData:
+        """获取用户藏品列表"""
+        return self._send(self._user_position_list_request(page, page_size, access_token))
@@ -0,0 +1,60 @@
+import json
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, parse_obj_as
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def loads(data: str | bytes) -> Any:
+    """解析 json, 安装了 orjson 时使用 orjson, 解析失败抛出 ValueError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@lru_cache(maxsize=None)
+def _simple_fields(model: Type[BaseModel]) -> Optional[Tuple[Tuple[str, type], ...]]:
+    """只包含必填 str/int 字段且没有自定义校验的模型返回 ((字段名, 类型), ...), 否则返回 None"""
+    if model.__pre_root_validators__ or model.__post_root_validators__ or model.__private_attributes__:
+        return None
+    fields = []
+    for name, field in model.__fields__.items():
+        if not field.required or field.alias != name or field.class_validators or field.outer_type_ not in (str, int):
+            return None
+        fields.append((name, field.outer_type_))
+    return tuple(fields)
+
+
+def parse_obj_list(model: Type[ModelT], items: List[Any]) -> List[ModelT]:
+    """
+    批量解析模型列表
+    简单模型的所有字段类型都正确时跳过逐个 pydantic 校验, 否则按 pydantic 完整校验
+    """
+    fields = _simple_fields(model)
+    if fields is None or not isinstance(items, list):
+        return parse_obj_as(List[model], items)
+
+    fields_set = {name for name, _ in fields}
+    result: List[ModelT] = []
+    for item in items:
+        if type(item) is not dict:
+            return parse_obj_as(List[model], items)
+        values = {}
+        for name, type_ in fields:
+            value = item.get(name)
+            if type(value) is not type_:
+                return parse_obj_as(List[model], items)
+            values[name] = value
+        # 同 BaseModel.construct, 省去默认值处理
+        obj = object.__new__(model)
+        object.__setattr__(obj, "__dict__", values)
+        object.__setattr__(obj, "__fields_set__", fields_set.copy())
+        result.append(obj)
+    return result
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-import requests
+import math
 import hashlib
-from pydantic import BaseModel, ConstrainedInt, ValidationError, Field
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ConstrainedInt, ValidationError, Field, parse_obj_as
 from loguru import logger
-from typing import Literal
+from typing import Iterator
+
+from .http_client import ResilientSession
+from .parsing import loads, parse_obj_list
 
 # https://www.weiyi.art/help/second/ebb5ab56726e451db01434bd35376420/9fa0f68a891a427aa2437dc702e08049
 
@@ -12,6 +16,17 @@ url = "http://qa-api.theone.art/verify-treasure/api/app/treasure/verifyUser"
 app_id = "PX1BASi3NU8k7gOM"
 app_key = "jfaO2wXD8zDcDh72nN8OYKoMWdKkY3Lz"
 
+# 接口固定每页 10 条
+PAGE_SIZE = 10
+MAX_PAGE = 50
+# 并发请求页数
+FETCH_CONCURRENCY = 5
+# (连接超时, 读取超时)
+FETCH_TIMEOUT = (3, 10)
+
+# 复用连接, 避免每页重新建立 TCP/TLS 连接
+http = ResilientSession(pool_maxsize=FETCH_CONCURRENCY, default_timeout=FETCH_TIMEOUT)
+
 
 class TreasureDetail(BaseModel):
     name: str
@@ -73,12 +88,6 @@ class TreasureData(BaseModel):
     treasureDetails: list[TreasureDetail] | None = None
 
 
-class ResponseModel(BaseModel):
-    code: Literal[200]
-    message: str
-    data: dict
-
-
 def encode_params(params: dict, key: str) -> str:
     s = []
     for k, v in sorted(params.items()):
@@ -87,55 +96,96 @@ def encode_params(params: dict, key: str) -> str:
     return "&".join(s)
 
 
-def get_user_treasure(phone: str, commodity_name: str | None = None):
-    treasure_list: list[TreasureDetail] = []
-    page_size = 10
-    max_page = 50
-    now_page = 0
-    while True:
-        # 参数名	参数值	是否必传	备注
-        # appId	testappId	是	商户id
-        # phone	133055333923	是	用户手机号
-        # commodityName	商品名	否	商品名称 选传
-        # categoryId	分类id	否	分类id 范围接口返回 选传
-        # pageCount	页码	否	分页页码 不传默认为1
-        # sourceTypes	来源	否	不传默认是全部 2购买 3空投 4补发 5盲盒 6赠与 数据格式 ,分割的字符串 例如 1）购买 2; 2）空投+盲盒：3,5
-        # type	类型	否	 1：版权品，2：衍生品，3：数字身份
-        now_page += 1
-        params = {
-            "appId": app_id,
-            "phone": phone,
-            "pageCount": now_page,
-        }
-        if commodity_name:
-            params["commodityName"] = commodity_name
-
-        str_to_sign = encode_params(params, key=app_key)
-        sign = hashlib.md5(str_to_sign.encode()).hexdigest().upper()
-
-        response = requests.post(url, json={**params, "sign": sign})
-        if not response.ok:
-            logger.warning(response.text)
-            raise ValueError(f"请求失败: {response.status_code}")
+def build_treasure_request(phone: str, page: int, commodity_name: str | None = None) -> dict:
+    """签名后的请求参数"""
+    # 参数名	参数值	是否必传	备注
+    # appId	testappId	是	商户id
+    # phone	133055333923	是	用户手机号
+    # commodityName	商品名	否	商品名称 选传
+    # categoryId	分类id	否	分类id 范围接口返回 选传
+    # pageCount	页码	否	分页页码 不传默认为1
+    # sourceTypes	来源	否	不传默认是全部 2购买 3空投 4补发 5盲盒 6赠与 数据格式 ,分割的字符串 例如 1）购买 2; 2）空投+盲盒：3,5
+    # type	类型	否	 1：版权品，2：衍生品，3：数字身份
+    params = {
+        "appId": app_id,
+        "phone": phone,
+        "pageCount": page,
+    }
+    if commodity_name:
+        params["commodityName"] = commodity_name
+
+    str_to_sign = encode_params(params, key=app_key)
+    sign = hashlib.md5(str_to_sign.encode()).hexdigest().upper()
+    return {**params, "sign": sign}
+
+
+def parse_treasure_response(status_code: int, text: str | bytes) -> TreasureData:
+    """只解析一次 json, 藏品列表批量校验"""
+    if status_code >= 400:
+        logger.warning(text)
+        raise ValueError(f"请求失败: {status_code}")
+    try:
+        payload = loads(text)
+    except ValueError:
+        logger.warning(text)
+        raise ValueError("解析错误")
+    try:
+        if not isinstance(payload, dict):
+            raise ValueError("解析错误")
+        if payload.get("code") != 200:
+            raise ValueError(ErrorResponse.parse_obj(payload).message)
+        data = payload.get("data")
+        if not isinstance(data, dict):
+            raise ValueError("解析错误")
+        details = data.get("treasureDetails")
+        return TreasureData.construct(
+            totalCount=parse_obj_as(int, data.get("totalCount")),
+            treasureDetails=None if details is None else parse_obj_list(TreasureDetail, details),
+        )
+    except ValidationError:
+        logger.warning(text)
+        raise ValueError("解析错误")
+
+
+def fetch_treasure_page(phone: str, page: int, commodity_name: str | None = None) -> TreasureData:
+    """获取一页藏品"""
+    response = http.post("verifyUser", url, idempotent=True, json=build_treasure_request(phone, page, commodity_name))
+    return parse_treasure_response(response.status_code, response.text)
+
+
+def get_total_page(first: TreasureData) -> int:
+    """第一页之后还需要请求的最大页码, 0 为不需要"""
+    if not first.treasureDetails or len(first.treasureDetails) < PAGE_SIZE:
+        return 0
+    return min(math.ceil(first.totalCount / PAGE_SIZE), MAX_PAGE)
+
+
+def iter_user_treasure_pages(
+    phone: str,
+    commodity_name: str | None = None,
+    concurrency: int = FETCH_CONCURRENCY,
+) -> Iterator[TreasureData]:
+    """
+    按页码顺序逐页返回藏品, 空页不返回
+    第一页返回总数后, 其余页并发请求
+    """
+    first = fetch_treasure_page(phone, 1, commodity_name)
+    if not first.treasureDetails:
+        return
+    yield first
+
+    pages = range(2, get_total_page(first) + 1)
+    if not pages:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pages)))) as executor:
+        futures = [executor.submit(fetch_treasure_page, phone, page, commodity_name) for page in pages]
         try:
-            raw = ResponseModel.parse_raw(response.text)
-            data = TreasureData.parse_obj(raw.data)
-        except ValidationError:
-            try:
-                err_resp = ErrorResponse.parse_raw(response.text)
-                raise ValueError(err_resp.message)
-            except ValidationError:
-                logger.warning(response.text)
-                raise ValueError("解析错误")
-
-        if not data.treasureDetails:
-            break
-        treasure_list.extend(data.treasureDetails)
-        if len(treasure_list) < 10:
-            break
-        if now_page * page_size == data.totalCount:
-            break
-        if now_page >= max_page:
-            break
-
-    return treasure_list
+            for future in futures:
+                data = future.result()
+                if not data.treasureDetails:
+                    break
+                yield data
+        finally:
+            for future in futures:
+                future.cancel()
@@ -1,7 +1,11 @@
+from collections import defaultdict
+from functools import partial
 from decimal import Decimal
-from user.models import User, UserWeiyiTreasure, WeiyiTreasureInfo
-from openapi.models import OpenApp
+from typing import Dict, Iterable, List, NamedTuple
+from user.models import User, UserCreditsLog, UserWeiyiTreasure, WeiyiTreasureInfo
 from django.db import transaction
+from django.db.models import Case, F, When
+from backend.utils import job_queue, leaderboard, openapp_registry
 from backend.utils.order_utils import get_order_id
 from backend.settings import get_logger, get_redis_connection, REDIS_PREFIX
 
@@ -10,16 +14,22 @@ redis_conn = get_redis_connection()
 
 from redis.lock import Lock
 
-app = OpenApp.objects.get(app_id="mall")
-
 # TODO 积分倍率
 CREDITS_PER_YUAN = 10000
+# 每批处理的藏品数, 每批一个事务
+REBATE_CHUNK_SIZE = 200
+
 
+class RebatePayout(NamedTuple):
+    user: User  # 获得返利的用户
+    value: int
 
-@transaction.atomic()
-def apply_user_buy_rebate(user: User, info: WeiyiTreasureInfo):
+
+def compute_rebate(user: User, info: WeiyiTreasureInfo) -> List[RebatePayout]:
+    """计算用户购买藏品后上级和上上级的返利"""
+    payouts: List[RebatePayout] = []
     if user.parent is None:
-        return
+        return payouts
 
     credits_total = info.price * CREDITS_PER_YUAN
     parent_value = 0
@@ -35,16 +45,10 @@ def apply_user_buy_rebate(user: User, info: WeiyiTreasureInfo):
             f"name={info.name!r} user={user}:{user.level} parent={user.parent}:{user.parent_level} "
             f"value={parent_value} total={credits_total}"
         )
-        user.parent.change_credits_and_log(
-            order_id=get_order_id(),
-            operation=1,
-            value=parent_value,
-            channel="返利",
-            app=app,
-        )
+        payouts.append(RebatePayout(user=user.parent, value=parent_value))
 
     if user.parent_parent is None:
-        return
+        return payouts
 
     if (
         user.level == User.LevelChoice.C
@@ -57,16 +61,62 @@ def apply_user_buy_rebate(user: User, info: WeiyiTreasureInfo):
             f"parent_parent={user.parent_parent}:{user.parent_parent_level}"
             f"value={value} total={credits_total}"
         )
-        user.parent_parent.change_credits_and_log(
-            order_id=get_order_id(),
-            operation=1,
-            value=value,
-            channel="返利",
-            app=app,
+        payouts.append(RebatePayout(user=user.parent_parent, value=value))
+
+    return payouts
+
+
+def apply_payouts(treasure_ids: List[int], payouts: Iterable[RebatePayout]):
+    """一个事务内批量发放返利并标记藏品已返利"""
+    payouts = list(payouts)
+    totals: Dict[int, int] = defaultdict(int)
+    for payout in payouts:
+        totals[payout.user.id] += payout.value
+
+    app = openapp_registry.get_by_app_id("mall")
+    with transaction.atomic():
+        marked = UserWeiyiTreasure.objects.filter(id__in=treasure_ids, is_rebate=False).update(is_rebate=True)
+        if marked != len(treasure_ids):
+            # 已被其他进程处理, 回滚避免重复返利
+            raise ValueError(f"返利藏品状态已变化 {marked}/{len(treasure_ids)}")
+        if not totals:
+            return
+
+        User.objects.filter(id__in=totals).update(
+            credits=Case(*[When(id=user_id, then=F("credits") + value) for user_id, value in totals.items()], default=F("credits")),
+            total_income=Case(
+                *[When(id=user_id, then=F("total_income") + value) for user_id, value in totals.items()],
+                default=F("total_income"),
+            ),
+        )
+        UserCreditsLog.objects.bulk_create(
+            [
+                UserCreditsLog(
+                    order_id=get_order_id(),
+                    user_id=payout.user.id,
+                    operation=UserCreditsLog.OperationChoice.INCREASE,
+                    value=payout.value,
+                    channel="返利",
+                    app=app,
+                )
+                for payout in payouts
+            ]
+        )
+        user_ids = list(totals)
+        transaction.on_commit(lambda: leaderboard.sync_users(user_ids))
+        # 累计收益增加可能达到升级条件
+        transaction.on_commit(
+            partial(job_queue.enqueue, "backend.utils.user_level_update.update_users_level", user_ids=user_ids)
         )
 
 
-def do_rebate():
+def do_rebate(chunk_size: int = REBATE_CHUNK_SIZE, dry_run: bool = False):
+    """
+    批量返利
+    chunk_size: 每批处理的藏品数
+    dry_run: 只计算不发放
+    """
+    summary = {"treasures": 0, "payouts": 0, "value": 0}
     try:
         with Lock(
             redis=redis_conn,
@@ -74,14 +124,40 @@ def do_rebate():
             timeout=30,
             blocking=True,
             blocking_timeout=5,
-        ):
-            queryset = UserWeiyiTreasure.objects.filter(
-                is_rebate=False,
-                # 无价格商品直接排除
-                commodity_uuid__in=WeiyiTreasureInfo.objects.values_list("commodity_uuid"),
+        ) as lock:
+            infos = {i.commodity_uuid: i for i in WeiyiTreasureInfo.objects.all()}
+            queryset = (
+                UserWeiyiTreasure.objects.filter(
+                    is_rebate=False,
+                    user__isnull=False,
+                    # 无价格商品直接排除
+                    commodity_uuid__in=WeiyiTreasureInfo.objects.values_list("commodity_uuid"),
+                )
+                .select_related("user__parent", "user__grandparent")
+                .order_by("id")
             )
-            for i in queryset:
-                info = WeiyiTreasureInfo.objects.get(commodity_uuid=i.commodity_uuid)
-                apply_user_buy_rebate(user=i.user, info=info)
+            last_id = 0
+            while True:
+                treasures = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not treasures:
+                    break
+                last_id = treasures[-1].id
+
+                payouts: List[RebatePayout] = []
+                for i in treasures:
+                    info = infos.get(i.commodity_uuid)
+                    if info is not None:
+                        payouts.extend(compute_rebate(user=i.user, info=info))
+
+                summary["treasures"] += len(treasures)
+                summary["payouts"] += len(payouts)
+                summary["value"] += sum(i.value for i in payouts)
+                if not dry_run:
+                    apply_payouts(treasure_ids=[i.id for i in treasures], payouts=payouts)
+                lock.reacquire()
     except Exception as e:
-        logger.warning(e)
+        # 抛出给任务队列重试, 已提交的批次不会重复返利
+        logger.warning(f"do_rebate dry_run={dry_run} {summary} {e!r}")
+        raise
+    logger.info(f"do_rebate dry_run={dry_run} {summary}")
+    return summary
@@ -0,0 +1,93 @@
+import datetime
+from typing import Optional
+
+from ninja.errors import AuthenticationError
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+from backend.utils import job_queue
+from backend.utils.weiyi import weiyi_client
+from backend.utils.weiyi.models import AccessTokenData
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 当前 access token, 过期时间比实际提前 REFRESH_MARGIN 秒
+ACCESS_TOKEN_KEY = f"{REDIS_PREFIX}:weiyi:access_token:"
+# 上次刷新后是否使用过, 未使用的不主动刷新
+TOKEN_USED_KEY = f"{REDIS_PREFIX}:weiyi:token_used:"
+REFRESH_LOCK_KEY = f"{REDIS_PREFIX}:lock:weiyi_token_refresh:"
+
+# 剩余时间低于该值时同步刷新
+REFRESH_MARGIN = 30
+# 过期前提前在后台刷新
+PROACTIVE_REFRESH_BEFORE = 5 * 60
+# 等待其他进程刷新的最长时间, 需大于刷新接口超时
+REFRESH_LOCK_WAIT = 15
+
+
+def cache_access_token(user_id: int, token: AccessTokenData, expire_at: datetime.datetime):
+    """保存到 redis, 并安排过期前后台刷新"""
+    ttl = int((expire_at - datetime.datetime.now()).total_seconds())
+    if ttl > REFRESH_MARGIN:
+        redis_conn.set(ACCESS_TOKEN_KEY + str(user_id), token.accessToken, ex=ttl - REFRESH_MARGIN)
+    if ttl > PROACTIVE_REFRESH_BEFORE:
+        job_queue.enqueue_in(
+            ttl - PROACTIVE_REFRESH_BEFORE,
+            "backend.utils.weiyi_token.proactive_refresh",
+            user_id=user_id,
+        )
+
+
+def refresh_access_token(user_id: int, min_ttl: int = REFRESH_MARGIN) -> str:
+    """
+    剩余时间低于 min_ttl 时刷新, 同一用户同时只有一个进程调用刷新接口
+    refresh token 刷新后失效, 并发刷新会互相作废
+    """
+    from user.models import User
+
+    try:
+        with Lock(
+            redis=redis_conn,
+            name=REFRESH_LOCK_KEY + str(user_id),
+            timeout=REFRESH_LOCK_WAIT * 2,
+            blocking=True,
+            blocking_timeout=REFRESH_LOCK_WAIT,
+        ):
+            # 持锁后重新读取, 等锁期间可能已被其他进程刷新
+            user = User.objects.only("id", "weiyi_token", "weiyi_token_expire_at").get(id=user_id)
+            if not user.weiyi_token:
+                raise AuthenticationError()
+            token = AccessTokenData.parse_obj(user.weiyi_token)
+            now = datetime.datetime.now()
+            expire_at = user.weiyi_token_expire_at or now
+            if (expire_at - now).total_seconds() >= min_ttl:
+                cache_access_token(user_id, token, expire_at)
+                return token.accessToken
+
+            token = weiyi_client.refresh_token(token.refreshToken)
+            user.save_weiyi_token(token)
+            logger.info(f"weiyi token refreshed user={user_id}")
+            return token.accessToken
+    except LockError as e:
+        logger.warning(e)
+        raise ValueError("唯艺登录状态刷新中, 请稍后再试")
+
+
+def get_access_token(user_id: int) -> str:
+    """获取有效的 access token, 优先读取 redis"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.get(ACCESS_TOKEN_KEY + str(user_id))
+    pipe.set(TOKEN_USED_KEY + str(user_id), 1, ex=24 * 60 * 60)
+    access_token: Optional[str] = pipe.execute()[0]
+    if access_token:
+        return access_token
+    return refresh_access_token(user_id)
+
+
+def proactive_refresh(user_id: int):
+    """过期前后台刷新, 上次刷新后未使用的用户跳过, 下次使用时再同步刷新"""
+    if not redis_conn.delete(TOKEN_USED_KEY + str(user_id)):
+        return
+    refresh_access_token(user_id, min_ttl=PROACTIVE_REFRESH_BEFORE + REFRESH_MARGIN)
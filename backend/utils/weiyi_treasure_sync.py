@@ -0,0 +1,100 @@
+import datetime
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
+
+from user.models import TreasureSyncResult, User, UserWeiyiTreasure, UserWeiyiTreasureSync
+from backend.utils.weiyi import aio
+from backend.utils.weiyi.treasure_api import MAX_PAGE, PAGE_SIZE, TreasureData, TreasureDetail
+from backend.settings import get_logger
+
+logger = get_logger()
+
+# 冷却时间内重复同步直接返回
+SYNC_COOLDOWN = 60
+
+
+def hash_page(treasures: List[TreasureDetail]) -> str:
+    content = [[i.commodityUuid, i.number, i.name, i.cover, i.typeMarket] for i in treasures]
+    return hashlib.md5(json.dumps(content, ensure_ascii=False).encode()).hexdigest()
+
+
+def reset_sync_state(user_ids: Set[int]):
+    """藏品被其他用户同步走后, 原持有人下次同步需要完整写入"""
+    if user_ids:
+        UserWeiyiTreasureSync.objects.filter(user_id__in=user_ids).update(page_hashes={})
+
+
+def get_sync_state(user: User, force: bool = False) -> Optional[UserWeiyiTreasureSync]:
+    """获取同步状态, 冷却时间内返回 None"""
+    state, _ = UserWeiyiTreasureSync.objects.get_or_create(user=user)
+    now = datetime.datetime.now()
+    if not force and state.sync_time and (now - state.sync_time).total_seconds() < SYNC_COOLDOWN:
+        return None
+    return state
+
+
+def apply_treasure_pages(user: User, state: UserWeiyiTreasureSync, pages: Iterable[TreasureData]) -> TreasureSyncResult:
+    """
+    按页写入藏品, 内容未变的页跳过写入
+    完整拉取后把已不在用户名下的藏品置空
+    """
+    now = datetime.datetime.now()
+    page_hashes: Dict[str, str] = {}
+    seen: Set[Tuple[str, int]] = set()
+    created = updated = unchanged = 0
+    previous_user_ids: Set[int] = set()
+    total_count = 0
+    for page, data in enumerate(pages, start=1):
+        treasures = data.treasureDetails or []
+        total_count = data.totalCount
+        seen.update((i.commodityUuid, i.number) for i in treasures)
+        page_hash = hash_page(treasures)
+        page_hashes[str(page)] = page_hash
+        if state.page_hashes.get(str(page)) == page_hash:
+            unchanged += len(treasures)
+            continue
+        result = UserWeiyiTreasure.bulk_sync(user=user, treasures=treasures)
+        created += result.created
+        updated += result.updated
+        unchanged += result.unchanged
+        previous_user_ids.update(result.previous_user_ids)
+
+    # 超过最大页数或中途遇到空页(并发拉取期间藏品变动)时拉取不完整, 不判断移除
+    removed = 0
+    if total_count <= MAX_PAGE * PAGE_SIZE and len(seen) == total_count:
+        stale = [
+            _id
+            for _id, commodity_uuid, number in UserWeiyiTreasure.objects.filter(user=user).values_list("id", "commodity_uuid", "number")
+            if (commodity_uuid, number) not in seen
+        ]
+        if stale:
+            removed = UserWeiyiTreasure.objects.filter(id__in=stale, user=user).update(user=None)
+
+    reset_sync_state(previous_user_ids)
+    state.sync_time = now
+    state.total_count = total_count
+    state.page_hashes = page_hashes
+    state.save(update_fields=["sync_time", "total_count", "page_hashes"])
+
+    result = TreasureSyncResult(
+        created=created,
+        updated=updated,
+        unchanged=unchanged,
+        previous_user_ids=previous_user_ids,
+        removed=removed,
+    )
+    logger.info(f"apply_treasure_pages user={user} total={total_count} {result}")
+    return result
+
+
+async def async_sync_user_treasure(user: User, force: bool = False) -> Optional[TreasureSyncResult]:
+    """增量同步用户藏品, 冷却时间内返回 None, 拉取期间不占用线程, 拉取完成后一次写入"""
+    state = await sync_to_async(get_sync_state)(user, force)
+    if state is None:
+        return None
+    async with aio.treasure_http.scope():
+        pages = [data async for data in aio.iter_user_treasure_pages(user.phone)]
+    return await sync_to_async(apply_treasure_pages)(user, state, pages)
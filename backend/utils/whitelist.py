@@ -0,0 +1,114 @@
+from typing import Dict, Iterable, List, Tuple
+
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+from backend.settings import REDIS_PREFIX, get_logger, get_redis_connection
+
+logger = get_logger()
+redis_conn = get_redis_connection()
+
+# 白名单用户id集合
+WHITELIST_USERS_KEY = f"{REDIS_PREFIX}:whitelist:users"
+# 集合构建完成标记, 过期后重建, 控制未命中结果的最长过期时间
+WHITELIST_READY_KEY = f"{REDIS_PREFIX}:whitelist:ready"
+WHITELIST_MAX_STALENESS = 60 * 60
+# 兼容其他项目读取的白名单标记
+SHARED_WHITELIST_KEY = "shared:whitelist:"
+
+
+def _query_whitelisted(user_ids: Iterable[int] | None = None) -> List[Tuple[int, str]]:
+    """从数据库查询白名单用户 [(user_id, phone)]"""
+    from user.models import UserWeiyiTreasure, WeiyiTreasureInfo
+
+    queryset = UserWeiyiTreasure.objects.filter(
+        user__isnull=False,
+        commodity_uuid__in=WeiyiTreasureInfo.objects.filter(
+            is_whitelist=True,
+        ).values_list("commodity_uuid"),
+    )
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=list(user_ids))
+    return list(queryset.values_list("user", "user__phone").distinct().order_by())
+
+
+def rebuild():
+    """从数据库重建白名单集合"""
+    users = _query_whitelisted()
+    tmp_key = f"{WHITELIST_USERS_KEY}:rebuild"
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.delete(tmp_key)
+    if users:
+        pipe.sadd(tmp_key, *[user_id for user_id, _ in users])
+        pipe.rename(tmp_key, WHITELIST_USERS_KEY)
+    else:
+        pipe.delete(WHITELIST_USERS_KEY)
+    for _, phone in users:
+        pipe.set(SHARED_WHITELIST_KEY + phone, 1)
+    pipe.set(WHITELIST_READY_KEY, 1, ex=WHITELIST_MAX_STALENESS)
+    pipe.execute()
+    logger.info(f"whitelist rebuilt: {len(users)}")
+
+
+def invalidate():
+    """白名单藏品变动后调用, 下次查询时重建"""
+    redis_conn.delete(WHITELIST_READY_KEY)
+
+
+def ensure_ready() -> bool:
+    """确保集合已构建, 获取重建锁失败返回 False"""
+    if redis_conn.exists(WHITELIST_READY_KEY):
+        return True
+    try:
+        with Lock(
+            redis=redis_conn,
+            name=f"{REDIS_PREFIX}:lock:whitelist_rebuild",
+            timeout=30,
+            blocking=True,
+            blocking_timeout=5,
+        ):
+            if not redis_conn.exists(WHITELIST_READY_KEY):
+                rebuild()
+        return True
+    except LockError as e:
+        logger.warning(e)
+        return False
+
+
+def is_whitelisted_many(user_ids: Iterable[int]) -> Dict[int, bool]:
+    """批量查询是否是白名单"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    if not ensure_ready():
+        whitelisted = {user_id for user_id, _ in _query_whitelisted(user_ids)}
+        return {user_id: user_id in whitelisted for user_id in user_ids}
+
+    pipe = redis_conn.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.sismember(WHITELIST_USERS_KEY, user_id)
+    return {user_id: bool(result) for user_id, result in zip(user_ids, pipe.execute())}
+
+
+def is_whitelisted(user_id: int) -> bool:
+    """查询是否是白名单"""
+    return is_whitelisted_many([user_id])[user_id]
+
+
+def refresh_users(user_ids: Iterable[int]):
+    """藏品同步后刷新指定用户的白名单状态"""
+    from user.models import User
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    whitelisted = {user_id for user_id, _ in _query_whitelisted(user_ids)}
+    pipe = redis_conn.pipeline(transaction=False)
+    for user_id, phone in User.objects.filter(id__in=user_ids).values_list("id", "phone"):
+        if user_id in whitelisted:
+            pipe.sadd(WHITELIST_USERS_KEY, user_id)
+            pipe.set(SHARED_WHITELIST_KEY + phone, 1)
+        else:
+            pipe.srem(WHITELIST_USERS_KEY, user_id)
+            pipe.delete(SHARED_WHITELIST_KEY + phone)
+    pipe.execute()
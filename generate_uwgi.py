@@ -61,6 +61,10 @@ uid=root
 gid=root
 # 启用主进程
 master=true
+# 后台任务进程, 由主进程管理, touch uwsgi.reload 时与 worker 一起重启加载新代码
+attach-daemon2=cmd=venv/bin/python manage.py run_jobs,touch=uwsgi.reload
+# 每6小时全量校正用户等级, 平时由 update_users_level 增量更新; 上次未结束时不重复启动, 不要再加到 settings.CRONJOBS
+unique-cron=0 -6 -1 -1 -1 venv/bin/python manage.py update_user_level >> logs/crontab.log 2>&1
 # 退出时尝试删除所有生成的socket和pid文件
 vacuum=true
 # 加锁串行化接收, 避免多进程惊群问题